@@ -0,0 +1 @@
+__all__ = ['stubs', 'retrieval', 'quantization', 'import_time']
\ No newline at end of file
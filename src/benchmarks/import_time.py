@@ -0,0 +1,86 @@
+"""
+Import-time budget check.
+
+Imports each module in a fresh interpreter and checks that it stays within its time budget and does not load heavy dependencies it defers to first use (Docling, PyTorch, Sentence-Transformers, Weaviate). Exits with status 1 on any violation, so it can gate CI or a release. Budgets are wall-clock milliseconds for a warm filesystem cache; `--scale` loosens or tightens them for slower or faster machines.
+
+Usage (from `src/`):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --scale 2 --repeat 5
+"""
+# Utils
+import sys
+import json
+import argparse
+import subprocess
+# ===================================================================== #
+
+HEAVY = ("torch", "sentence_transformers", "docling", "langchain_docling", "weaviate")
+
+# Module: (budget in ms, modules it must not load)
+BUDGETS = {
+    "utils.config": (100, HEAVY),
+    "utils.helpers": (100, HEAVY),
+    "utils.parent_index": (150, HEAVY),
+    "utils.instrumentation": (100, HEAVY),
+    "preprocessing.embedding": (1000, HEAVY),
+    "preprocessing.embedding_store": (1000, HEAVY),
+    "preprocessing.document": (2500, ("torch", "sentence_transformers", "docling", "langchain_docling")),
+    "retriever.reranker": (300, HEAVY),
+    "retriever.semantic_cache": (600, HEAVY),
+    "retriever.mmr": (300, HEAVY),
+    "retriever.local_index": (2000, ("torch", "sentence_transformers", "docling", "langchain_docling")),
+    "retriever.weaviate_retriever": (3000, ("torch", "sentence_transformers", "docling", "langchain_docling")),
+}
+
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+# --------------------------------------------------------------------- #
+
+def measure(module: str, heavy: tuple, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-W", "ignore", "-c", PROBE.format(module=module, heavy=heavy)],
+                                capture_output=True, text=True)
+        if (result.returncode != 0):
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {"ms": round(min(run["ms"] for run in runs), 1), "loaded": runs[0]["loaded"]}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check module import times against their budgets.")
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per module (the fastest one counts)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier applied to every budget")
+    parser.add_argument("--only", nargs="*", help="Check only these modules")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module, (budget, heavy) in BUDGETS.items():
+        if (args.only) and (module not in args.only):
+            continue
+        result = measure(module, heavy, args.repeat)
+        budget *= args.scale
+
+        if ("error" in result):
+            status = f"ERROR {result['error']}"
+        elif (result["loaded"]):
+            status = f"FAIL loads {', '.join(result['loaded'])}"
+        elif (result["ms"] > budget):
+            status = "FAIL over budget"
+        else:
+            status = "ok"
+        if (status != "ok"):
+            failures.append(module)
+        print(f"{module:32s} {result.get('ms', float('nan')):8.1f} ms / {budget:6.0f} ms  {status}")
+
+    if (failures):
+        print(f"{len(failures)} module(s) over budget or loading deferred dependencies")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
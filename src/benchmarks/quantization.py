@@ -0,0 +1,163 @@
+"""
+Recall-vs-memory report for the vector index profiles.
+
+Simulates the compressed vector indexes Weaviate can build (8-bit scalar, product and binary quantization, each rescoring its top `--rescore-limit` candidates with the uncompressed vectors) and Matryoshka truncation of the embeddings, on the same corpus and queries. For every profile it reports the in-memory bytes per object (compressed vector plus HNSW links), the total for the corpus, how many more objects fit in the same memory than the full-precision index, and recall@k against exact full-precision search.
+
+With `--from-db`, the vectors of the `DB_NAME` collection are used and a held-out sample of them serves as queries (needs a running Weaviate). Otherwise a synthetic corpus is embedded with the hashing stand-in, which shows the mechanics but not the recall of the real model.
+
+Usage (from `src/`):
+    python -m benchmarks.quantization --from-db --dimensions 1024 512 256 --output quantization.json
+    python -m benchmarks.quantization --docs 20 --chunks 200
+"""
+# Utils
+from utils.config import *
+from utils.helpers import truncate_embeddings
+from benchmarks.stubs import HashEmbedding
+from benchmarks.retrieval import build_queries
+import sys
+import json
+import random
+import argparse
+import numpy as np
+# ===================================================================== #
+
+# -- Vectors -- #
+def synthetic_vectors(args) -> tuple[np.ndarray, np.ndarray]:
+    rng = random.Random(args.seed)
+    vocab = [f"w{i}" for i in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    texts = []
+    for _ in range(args.docs):
+        topic = rng.sample(vocab, 50)
+        for _ in range(args.chunks):
+            texts.append(" ".join(rng.choices(vocab, weights=weights, k=30) + rng.choices(topic, k=30)))
+
+    embedder = HashEmbedding(dim=max(args.dimensions), as_numpy=True)
+    return embedder.embed_documents(texts), embedder.encode(build_queries(texts, args.queries, seed=args.seed + 1))
+
+def database_vectors(args) -> tuple[np.ndarray, np.ndarray]:
+    from utils.db_config import DB
+    client = DB().connect()
+    try:
+        vectors = [obj.vector["default"] for obj in client.collections.get(DB_NAME).iterator(include_vector=True)]
+    finally:
+        client.close()
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    held_out = np.random.default_rng(args.seed).permutation(len(vectors))
+    return vectors[held_out[args.queries:]], vectors[held_out[:args.queries]]
+# --------------------------------------------------------------------- #
+
+# -- Quantizers (encode, then decode to the approximate vectors searched in memory) -- #
+def scalar_quantize(vectors: np.ndarray) -> tuple[np.ndarray, float]:
+    low, high = vectors.min(axis=0), vectors.max(axis=0)
+    scale = np.where(high > low, (high - low) / 255, 1)
+    codes = np.round((vectors - low) / scale).astype(np.uint8)
+    return codes * scale + low, vectors.shape[1]
+
+def binary_quantize(vectors: np.ndarray) -> tuple[np.ndarray, float]:
+    return np.where(vectors > 0, 1.0, -1.0).astype(np.float32), vectors.shape[1] / 8
+
+def product_quantize(vectors: np.ndarray, segment_dim=4, centroids=256, iterations=10, seed=0) -> tuple[np.ndarray, float]:
+    rng = np.random.default_rng(seed)
+    decoded = np.empty_like(vectors)
+    for start in range(0, vectors.shape[1], segment_dim):
+        segment = vectors[:, start:start + segment_dim]
+        codebook = segment[rng.choice(len(segment), min(centroids, len(segment)), replace=False)]
+        for _ in range(iterations):
+            assignment = nearest(segment, codebook)
+            for c in range(len(codebook)):
+                members = segment[assignment == c]
+                if (len(members)):
+                    codebook[c] = members.mean(axis=0)
+        decoded[:, start:start + segment_dim] = codebook[nearest(segment, codebook)]
+    return decoded, -(-vectors.shape[1] // segment_dim)
+
+def nearest(points: np.ndarray, codebook: np.ndarray) -> np.ndarray:
+    distances = (points ** 2).sum(axis=1, keepdims=True) - 2 * points @ codebook.T + (codebook ** 2).sum(axis=1)
+    return distances.argmin(axis=1)
+
+QUANTIZERS = {"none": None, "sq": scalar_quantize, "pq": product_quantize, "bq": binary_quantize}
+# --------------------------------------------------------------------- #
+
+# -- Search -- #
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def top_k(queries: np.ndarray, vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ vectors.T
+    k = min(k, vectors.shape[0])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, candidates, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+def search(queries: np.ndarray, vectors: np.ndarray, approximate: np.ndarray, k: int, rescore_limit: int) -> np.ndarray:
+    if (approximate is None):
+        return top_k(queries, vectors, k)
+    # Candidates from the compressed vectors, re-ordered by the uncompressed ones
+    candidates = top_k(queries, normalize(approximate), max(k, rescore_limit))
+    rescored = np.einsum("qd,qcd->qc", queries, vectors[candidates])
+    order = np.argsort(-rescored, axis=1)[:, :k]
+    return np.take_along_axis(candidates, order, axis=1)
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+# --------------------------------------------------------------------- #
+
+def report(vectors: np.ndarray, queries: np.ndarray, args) -> list[dict]:
+    vectors, queries = normalize(vectors), normalize(queries)
+    truth = top_k(queries, vectors, args.k)
+    graph_bytes = 2 * args.max_connections * 8        # Layer-0 HNSW links per object
+
+    rows = []
+    for dimensions in args.dimensions:
+        truncated, truncated_queries = truncate_embeddings(vectors, dimensions), truncate_embeddings(queries, dimensions)
+        for quantization in args.quantization:
+            quantizer = QUANTIZERS[quantization]
+            approximate, vector_bytes = quantizer(truncated) if (quantizer) else (None, truncated.shape[1] * 4)
+            found = search(truncated_queries, truncated, approximate, args.k, args.rescore_limit)
+            rows.append({
+                "dimensions": truncated.shape[1],
+                "quantization": quantization,
+                "bytes_per_object": int(vector_bytes + graph_bytes),
+                "memory_mb": round(len(vectors) * (vector_bytes + graph_bytes) / 2**20, 2),
+                f"recall@{args.k}": round(recall(found, truth), 4),
+            })
+
+    baseline = vectors.shape[1] * 4 + graph_bytes     # Full-dimension float32 index
+    for row in rows:
+        row["capacity_x"] = round(baseline / row["bytes_per_object"], 2)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report recall against memory for quantized and truncated vector indexes.")
+    parser.add_argument("--from-db", action="store_true", help=f"Use the vectors of the '{DB_NAME}' collection")
+    parser.add_argument("--docs", type=int, default=20, help="Synthetic documents")
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks per synthetic document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[1024, 512, 256])
+    parser.add_argument("--quantization", nargs="+", default=list(QUANTIZERS), choices=list(QUANTIZERS))
+    parser.add_argument("--k", type=int, default=16)
+    parser.add_argument("--rescore-limit", type=int, default=VECTOR_RESCORE_LIMIT)
+    parser.add_argument("--max-connections", type=int, default=32, help="HNSW maxConnections of the collection")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+    args.dimensions = sorted(set(args.dimensions), reverse=True)
+
+    vectors, queries = database_vectors(args) if (args.from_db) else synthetic_vectors(args)
+    rows = report(vectors, queries, args)
+
+    print(f"{'dims':>6} {'quant':>6} {'bytes/obj':>10} {'memory MB':>10} {'capacity':>9} {'recall@' + str(args.k):>10}")
+    for row in rows:
+        print(f"{row['dimensions']:>6} {row['quantization']:>6} {row['bytes_per_object']:>10} {row['memory_mb']:>10} "
+              f"{row['capacity_x']:>8}x {row[f'recall@{args.k}']:>10}")
+
+    if (args.output):
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args) | {"objects": len(vectors)}, "results": rows}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Retrieval benchmark suite.
+
+Builds a synthetic corpus in an in-process stand-in for the Weaviate collection, with deterministic stand-ins for the embedding model and the cross-encoder, then times the `Retriever` search methods. Reports p50/p95/p99 latency, QPS and peak traced memory per method, and saves the results as JSON. Passing `--baseline` compares the run against an earlier results file and exits with status 1 when a method's p50 latency regressed beyond `--tolerance`.
+
+Usage (from `src/`):
+    python -m benchmarks.retrieval --docs 20 --chunks 200 --queries 200 --output bench.json
+    python -m benchmarks.retrieval --baseline bench.json
+    python -m benchmarks.retrieval --latency-ms 2 --only similarity_search multi_query_search   # model database round trips
+"""
+# Utils
+from utils.config import *
+from utils.helpers import text_hash
+from utils.parent_index import ParentIndex
+from retriever.reranker import Reranker
+from retriever.weaviate_retriever import Retriever
+from retriever.local_index import LocalIndex
+from benchmarks.stubs import HashEmbedding, StubCrossEncoder, InMemoryClient
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+from weaviate.classes.data import DataObject
+from langchain_core.documents import Document
+# ===================================================================== #
+
+# -- Synthetic Corpus -- #
+def build_corpus(client: InMemoryClient, embedder: HashEmbedding, parent_index: ParentIndex,
+                 docs=20, chunks=200, words=60, vocabulary=5000, seed=0) -> list[str]:
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]   # Zipf-like word frequencies
+    collection = client.collections.get(DB_NAME)
+
+    texts = []
+    for d in range(docs):
+        source_id = f"doc-{d}"
+        topic = rng.sample(vocab, 50)
+        doc_props = []
+        for i in range(chunks):
+            tokens = rng.choices(vocab, weights=weights, k=words // 2) + rng.choices(topic, k=words // 2)
+            rng.shuffle(tokens)
+            text = " ".join(tokens)
+            doc_props.append({"index": i, "source_id": source_id, "page_no": str(i // 4 + 1), "text": text,
+                              "l1": i // L1, "l2": i // L2, "content_hash": text_hash(text)})
+            texts.append(text)
+
+        vectors = embedder.embed_documents([props["text"] for props in doc_props])
+        collection.data.insert_many([DataObject(properties=props, vector=vector) for props, vector in zip(doc_props, vectors)])
+        parent_index.build(source_id, doc_props)
+    return texts
+
+def build_queries(texts: list[str], n: int, words=8, seed=1) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.sample(rng.choice(texts).split(), words)) for _ in range(n)]
+
+def subtopics(query: str, n=4) -> list[str]:
+    # Splits a query into `n` shorter subqueries, standing in for the subtopics of a lesson
+    words = query.split()
+    step = max(1, len(words) // n)
+    return [" ".join(words[i:i + step]) for i in range(0, len(words), step)][:n]
+# --------------------------------------------------------------------- #
+
+# -- Measurement -- #
+def measure(fn, queries: list[str], warmup=5, memory_samples=10) -> dict:
+    for query in queries[:warmup]:
+        fn(query)
+
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+
+    # Peak memory is traced on a separate pass, tracing slows the calls down
+    tracemalloc.start()
+    for query in queries[:memory_samples]:
+        fn(query)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "calls": len(queries),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "qps": round(len(queries) / total, 2),
+        "peak_traced_kb": round(peak / 1024, 1),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, stats in results["results"].items():
+        before = baseline["results"].get(name)
+        if not (before):
+            continue
+        ratio = stats["p50_ms"] / before["p50_ms"] if (before["p50_ms"]) else 1.0
+        print(f"{name:45s} p50 {before['p50_ms']:9.3f} -> {stats['p50_ms']:9.3f} ms ({ratio:5.2f}x)")
+        if (ratio > 1 + tolerance):
+            regressions.append(name)
+    return regressions
+# --------------------------------------------------------------------- #
+
+# -- Benchmarks -- #
+def run(args) -> dict:
+    client = InMemoryClient()
+    embedder = HashEmbedding(dim=args.dim)
+    parent_index = ParentIndex(f"{tempfile.mkdtemp()}/parents.sqlite")
+    reranker = Reranker(model=StubCrossEncoder(), max_wait_ms=0)
+
+    start = time.perf_counter()
+    texts = build_corpus(client, embedder, parent_index, docs=args.docs, chunks=args.chunks, words=args.words, seed=args.seed)
+    build_seconds = time.perf_counter() - start
+    client.get(DB_NAME).latency = args.latency_ms / 1000
+
+    retriever = Retriever(client, embedder, reranker=reranker, parent_index=parent_index)
+    local_index = LocalIndex(client.get(DB_NAME), sources=(), path=tempfile.mkdtemp())
+    local_retriever = Retriever(client, embedder, reranker=reranker, parent_index=parent_index, local_index=local_index)
+    queries = build_queries(texts, args.queries, seed=args.seed + 1)
+    source_ids = [f"doc-{d}" for d in range(min(args.sources, args.docs))]
+    rerank_docs = [Document(page_content=text, metadata={}) for text in texts[:args.k]]
+
+    benchmarks = {
+        "similarity_search": lambda q: retriever.similarity_search(q, source_ids, k=args.k, top_k=args.top_k),
+        "similarity_search[local_index]": lambda q: local_retriever.similarity_search(q, source_ids, k=args.k, top_k=args.top_k),
+        "similarity_search[auto_merge]": lambda q: retriever.similarity_search(q, source_ids, auto_merge=True, k=args.k, top_k=args.top_k),
+        "similarity_search_with_relevance_scores": lambda q: retriever.similarity_search_with_relevance_scores(q, source_ids, k=args.k),
+        "max_marginal_relevance_search": lambda q: retriever.max_marginal_relevance_search(q, source_ids, k=args.top_k, fetch_k=args.fetch_k),
+        "max_marginal_relevance_search[large_fetch_k]": lambda q: retriever.max_marginal_relevance_search(q, source_ids, k=args.top_k, fetch_k=args.large_fetch_k),
+        "rerank_docs": lambda q: retriever.rerank_docs(q, rerank_docs, args.top_k),
+        "similarity_search[per_subtopic]": lambda q: [retriever.similarity_search(sub, source_ids, k=args.k, top_k=args.top_k) for sub in subtopics(q)],
+        "multi_query_search": lambda q: retriever.multi_query_search(subtopics(q), source_ids, k=args.k, top_k=args.top_k),
+    }
+
+    results = {}
+    for name, fn in benchmarks.items():
+        if (args.only) and (name.split("[")[0] not in args.only):
+            continue
+        results[name] = measure(fn, queries)
+        print(f"{name:45s} p50 {results[name]['p50_ms']:9.3f} ms  p99 {results[name]['p99_ms']:9.3f} ms  {results[name]['qps']:9.2f} qps")
+
+    return {
+        "config": vars(args) | {"objects": len(texts), "build_seconds": round(build_seconds, 3)},
+        "environment": environment(),
+        "results": results,
+    }
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "numpy": np.__version__, "commit": commit}
+# --------------------------------------------------------------------- #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Retriever against an in-memory vector store.")
+    parser.add_argument("--docs", type=int, default=20, help="Number of synthetic documents")
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks per document")
+    parser.add_argument("--words", type=int, default=60, help="Words per chunk")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension")
+    parser.add_argument("--sources", type=int, default=4, help="Number of source_ids searched per query")
+    parser.add_argument("--queries", type=int, default=200, help="Timed calls per method")
+    parser.add_argument("--k", type=int, default=16)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--large-fetch-k", type=int, default=500, help="MMR candidate pool for the large fetch_k run")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Simulated round trip of each database query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="Run only these methods")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against an earlier results file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed p50 slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if (args.output):
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if (args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if (regressions):
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
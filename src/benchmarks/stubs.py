@@ -0,0 +1,322 @@
+# Utils
+import math
+import uuid
+import zlib
+import time
+import numpy as np
+from types import SimpleNamespace
+from collections import Counter
+from langchain_core.embeddings import Embeddings
+from weaviate.collections.classes.internal import Object
+# ===================================================================== #
+
+# -- Deterministic Model Stand-ins -- #
+def tokenize(text: str) -> list[str]:
+    # Same as the collection's LOWERCASE tokenization of "text"
+    return text.lower().split()
+
+class HashEmbedding(Embeddings):
+    """
+    Deterministic bag-of-words embedding (feature hashing), standing in for the SentenceTransformer model.
+
+    Attributes:
+        dim (int): The vector dimension.
+        as_numpy (bool): Whether embeddings are returned as float32 NumPy arrays instead of Python lists.
+    """
+    def __init__(self, dim=256, as_numpy=False):
+        self.dim = dim
+        self.as_numpy = as_numpy
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in tokenize(text):
+                h = zlib.crc32(token.encode())
+                vectors[i, h % self.dim] += 1.0 if (h & 1 << 31) else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def embed_documents(self, texts: list[str]):
+        vectors = self.encode(texts)
+        return vectors if (self.as_numpy) else vectors.tolist()
+
+    def embed_query(self, text: str):
+        vector = self.encode([text])[0]
+        return vector if (self.as_numpy) else vector.tolist()
+# --------------------------------------------------------------------- #
+
+class StubCrossEncoder:
+    """
+    Deterministic token-overlap scorer, standing in for the `CrossEncoder` used by `Reranker`.
+    """
+    def predict(self, pairs: list[tuple[str, str]], batch_size=32, show_progress_bar=False) -> np.ndarray:
+        scores = np.empty(len(pairs), dtype=np.float32)
+        for i, (query, doc) in enumerate(pairs):
+            query_tokens, doc_tokens = set(tokenize(query)), set(tokenize(doc))
+            scores[i] = len(query_tokens & doc_tokens) / (len(query_tokens | doc_tokens) or 1)
+        return scores
+# ===================================================================== #
+
+# -- In-Memory Vector Store Stand-in -- #
+class InMemoryCollection:
+    """
+    In-process stand-in for the Weaviate collection API used by this project.
+
+    It keeps properties as columns and vectors as one float32 matrix, and implements the subset of `query` (hybrid, near_vector, fetch_objects, fetch_object_by_id), `data` (insert_many, delete_many, delete_by_id) and `batch` (fixed_size, dynamic) calls the `Retriever`, `DocumentProcessor` and `BatchWriter` make. Filters built with `weaviate.classes.query.Filter` are evaluated locally. Hybrid search uses BM25 and relative score fusion weighted by `alpha`, like Weaviate's default fusion.
+
+    Attributes:
+        name (str): The collection name.
+        query: The query interface (the collection itself).
+        data: The data interface (the collection itself).
+        latency (float): Simulated round-trip time of each query in seconds, to model a remote server.
+        batch (InMemoryBatch): The batch interface.
+    """
+    def __init__(self, name: str, k1=1.2, b=0.75, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.query = self
+        self.data = self
+        self.batch = InMemoryBatch(self)
+        self.k1 = k1
+        self.b = b
+        self.uuids = []
+        self.properties = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._columns = {}
+        self._postings = None
+    # ---------------------------------------------- #
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+    # ---------------------------------------------- #
+
+    # -- Data -- #
+    def insert_many(self, objects) -> SimpleNamespace:
+        positions = {obj_uuid: i for i, obj_uuid in enumerate(self.uuids)}
+        new_vectors = []
+        for obj in objects:
+            obj_uuid = str(obj.uuid or uuid.uuid4())
+            vector = np.asarray(obj.vector if (obj.vector is not None) else [], dtype=np.float32)
+            if (obj_uuid in positions):
+                # Same UUID: replace the object, like the batch endpoint
+                self.properties[positions[obj_uuid]] = dict(obj.properties)
+                self.vectors[positions[obj_uuid]] = vector
+                continue
+            positions[obj_uuid] = len(self.uuids)
+            self.uuids.append(obj_uuid)
+            self.properties.append(dict(obj.properties))
+            new_vectors.append(vector)
+
+        if (new_vectors):
+            new_vectors = np.stack(new_vectors)
+            self.vectors = new_vectors if (self.vectors.size == 0) else np.concatenate([self.vectors, new_vectors])
+        self._invalidate()
+        return SimpleNamespace(errors={}, has_errors=False, uuids=dict(enumerate(self.uuids[-len(objects):])))
+    # ---------------------------------------------- #
+
+    def delete_many(self, where) -> SimpleNamespace:
+        keep = ~self.match(where)
+        matches = int((~keep).sum())
+        self.uuids = [obj_uuid for obj_uuid, kept in zip(self.uuids, keep) if (kept)]
+        self.properties = [props for props, kept in zip(self.properties, keep) if (kept)]
+        self.vectors = self.vectors[keep] if (self.vectors.size) else self.vectors
+        self._invalidate()
+        return SimpleNamespace(matches=matches, successful=matches, failed=0)
+    # ---------------------------------------------- #
+
+    def delete_by_id(self, uuid) -> bool:
+        return self.delete_many(SimpleNamespace(target="_id", operator=SimpleNamespace(value="Equal"), value=str(uuid))).matches > 0
+    # ---------------------------------------------- #
+
+    # -- Query -- #
+    def fetch_objects(self, filters=None, limit=None, offset=0, sort=None, include_vector=False,
+                      return_properties=None, return_metadata=None, **kwargs) -> SimpleNamespace:
+        self._round_trip()
+        indices = np.flatnonzero(self.match(filters))
+        if (sort is not None):
+            for rule in reversed(sort.sorts):
+                indices = sorted(indices, key=lambda i: self.properties[i][rule.prop], reverse=not rule.ascending)
+        indices = list(indices)[offset:(offset + limit) if (limit) else None]
+        return self._response(indices, include_vector=include_vector)
+    # ---------------------------------------------- #
+
+    def fetch_object_by_id(self, uuid, **kwargs):
+        objects = self.fetch_objects(SimpleNamespace(target="_id", operator=SimpleNamespace(value="Equal"), value=str(uuid))).objects
+        return objects[0] if (objects) else None
+    # ---------------------------------------------- #
+
+    def near_vector(self, near_vector, filters=None, limit=10, include_vector=False, return_metadata=None, **kwargs) -> SimpleNamespace:
+        self._round_trip()
+        candidates = np.flatnonzero(self.match(filters))
+        distances = 1.0 - self.cosine(near_vector, candidates)
+        order = np.argsort(distances, kind="stable")[:limit]
+        return self._response(candidates[order], include_vector=include_vector, distances=distances[order])
+    # ---------------------------------------------- #
+
+    def hybrid(self, query, vector=None, filters=None, limit=10, alpha=0.5, include_vector=False, return_metadata=None, **kwargs) -> SimpleNamespace:
+        self._round_trip()
+        candidates = np.flatnonzero(self.match(filters))
+        if (candidates.size == 0):
+            return SimpleNamespace(objects=[])
+
+        # Relative score fusion of the vector and keyword searches
+        vector_scores = self.normalize(self.cosine(vector, candidates)) if (vector is not None) else np.zeros(candidates.size)
+        keyword_scores = self.normalize(self.bm25(query, candidates))
+        scores = alpha * vector_scores + (1 - alpha) * keyword_scores
+
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return self._response(candidates[order], include_vector=include_vector, scores=scores[order])
+    # ---------------------------------------------- #
+
+    # -- Scoring -- #
+    def cosine(self, vector, candidates: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        matrix = self.vectors[candidates]
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(vector) or 1)
+        return (matrix @ vector) / np.where(norms == 0, 1, norms)
+    # ---------------------------------------------- #
+
+    def bm25(self, query: str, candidates: np.ndarray) -> np.ndarray:
+        postings, lengths = self._index()
+        average_length = lengths.mean() if (lengths.size) else 0
+        scores = np.zeros(len(self.uuids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            docs = postings.get(token)
+            if not (docs):
+                continue
+            idf = math.log(1 + (len(self.uuids) - len(docs) + 0.5) / (len(docs) + 0.5))
+            doc_ids = np.fromiter(docs.keys(), dtype=np.int64)
+            tf = np.fromiter(docs.values(), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths[doc_ids] / average_length)
+            scores[doc_ids] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores[candidates]
+    # ---------------------------------------------- #
+
+    @staticmethod
+    def normalize(scores: np.ndarray) -> np.ndarray:
+        low, high = scores.min(), scores.max()
+        return (scores - low) / (high - low) if (high > low) else np.zeros_like(scores)
+    # ---------------------------------------------- #
+
+    # -- Filters -- #
+    def match(self, filters) -> np.ndarray:
+        if (filters is None):
+            return np.ones(len(self.uuids), dtype=bool)
+        if (hasattr(filters, "filters")):
+            masks = [self.match(f) for f in filters.filters]
+            if (type(filters).__name__ == "_FilterAnd"):
+                return np.logical_and.reduce(masks)
+            return np.logical_or.reduce(masks)
+
+        column = self._column(filters.target)
+        operator = filters.operator.value
+        if (operator == "Equal"):
+            return column == filters.value
+        if (operator == "NotEqual"):
+            return column != filters.value
+        if (operator == "ContainsAny"):
+            return np.isin(column, list(filters.value))
+        if (operator == "GreaterThan"):
+            return np.array([(value is not None) and (value > filters.value) for value in column], dtype=bool)
+        raise NotImplementedError(f"Filter operator {operator} is not supported by the in-memory collection")
+    # ---------------------------------------------- #
+
+    def _column(self, target: str) -> np.ndarray:
+        if (target not in self._columns):
+            values = self.uuids if (target == "_id") else [props.get(target) for props in self.properties]
+            self._columns[target] = np.array(values, dtype=object)
+        return self._columns[target]
+    # ---------------------------------------------- #
+
+    def _index(self):
+        if (self._postings is None):
+            postings, lengths = {}, []
+            for i, props in enumerate(self.properties):
+                tokens = tokenize(props.get("text", ""))
+                lengths.append(len(tokens))
+                for token, count in Counter(tokens).items():
+                    postings.setdefault(token, {})[i] = count
+            self._postings = (postings, np.array(lengths, dtype=np.float32))
+        return self._postings
+    # ---------------------------------------------- #
+
+    def _round_trip(self):
+        if (self.latency):
+            time.sleep(self.latency)
+    # ---------------------------------------------- #
+
+    def _invalidate(self):
+        self._columns = {}
+        self._postings = None
+    # ---------------------------------------------- #
+
+    def _response(self, indices, include_vector=False, scores=None, distances=None) -> SimpleNamespace:
+        objects = []
+        for n, i in enumerate(indices):
+            metadata = SimpleNamespace(score=float(scores[n]) if (scores is not None) else None,
+                                       distance=float(distances[n]) if (distances is not None) else None)
+            vector = {"default": self.vectors[i].tolist()} if (include_vector) else {}
+            objects.append(Object(uuid=self.uuids[i], metadata=metadata, properties=dict(self.properties[i]),
+                                  references=None, vector=vector, collection=self.name))
+        return SimpleNamespace(objects=objects)
+# --------------------------------------------------------------------- #
+
+class InMemoryBatch:
+    """
+    Stand-in for the collection batch interface. Objects are inserted `batch_size` at a time, and the next `failures` objects added are rejected and reported in `failed_objects`, to exercise retries.
+    """
+    def __init__(self, collection: InMemoryCollection):
+        self.collection = collection
+        self.batch_size = 100
+        self.failures = 0
+        self.failed_objects = []
+        self._buffer = []
+
+    def fixed_size(self, batch_size=100, concurrent_requests=2):
+        self.batch_size = batch_size
+        return self
+
+    def dynamic(self):
+        return self.fixed_size()
+
+    def __enter__(self):
+        self.failed_objects = []
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def add_object(self, properties, vector=None, uuid=None):
+        obj = SimpleNamespace(properties=properties, vector=vector, uuid=uuid)
+        if (self.failures):
+            self.failures -= 1
+            self.failed_objects.append(SimpleNamespace(message="simulated failure", object_=obj))
+            return
+        self._buffer.append(obj)
+        if (len(self._buffer) >= self.batch_size):
+            self.flush()
+
+    def flush(self):
+        if (self._buffer):
+            self.collection._round_trip()
+            self.collection.insert_many(self._buffer)
+            self._buffer = []
+# --------------------------------------------------------------------- #
+
+class InMemoryClient:
+    """
+    In-process stand-in for `WeaviateClient`, holding one `InMemoryCollection` per name.
+    """
+    def __init__(self, latency=0.0):
+        self.collections = self
+        self.latency = latency
+        self._collections = {}
+
+    def get(self, name: str) -> InMemoryCollection:
+        if (name not in self._collections):
+            self._collections[name] = InMemoryCollection(name, latency=self.latency)
+        return self._collections[name]
+
+    def exists(self, name: str) -> bool:
+        return name in self._collections
+# --------------------------------------------------------------------- #
@@ -1 +1 @@
-__all__ = ['document', 'embedding']
\ No newline at end of file
+__all__ = ['document', 'embedding', 'embedding_store', 'ingestion']
\ No newline at end of file
@@ -1,103 +1,315 @@
-from utils.config import *
-from utils.helpers import get_page_nos, id_filter
-
-from langchain_core.embeddings import Embeddings
-
-from weaviate import WeaviateClient
-from weaviate.collections import Collection
-import weaviate.classes as wvc
-
-from docling.chunking import HybridChunker
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.document_converter import DocumentConverter, PdfFormatOption
-
-from langchain_docling import DoclingLoader
-from langchain_docling.loader import ExportType
-
-pipeline_options = PdfPipelineOptions()
-pipeline_options.do_ocr = False
-pipeline_options.do_table_structure = True
-pipeline_options.table_structure_options.do_cell_matching = True
-doc_converter = DocumentConverter(
-    format_options={
-        InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options),
-    }
-)
-# --------------------------------------------------------------------- #
-
-# -- Document Class -- #
-class DocumentProcessor:
-    """
-    Processes and embeds documents for use in a RAG system.
-
-    This class handles the entire workflow of preparing a document for a retrieval-augmented generation (RAG) system. It loads a document, breaks it down into manageable chunks, generates vector embeddings for each chunk, and stores the data in a database.
-    
-    Attributes:
-        doc_path (str): The file path of the document to be processed.
-        doc_id (str): A unique identifier for the document.
-        chunks (List[str]): Stores the document chunks.
-        embeddings (List[List[float]]): Stores the generated embeddings.
-
-    Methods:
-        load_and_split(): Loads the document and splits it into chunks using a hybrid chunking strategy. The resulting chunks are stored in `self.chunks`.
-
-        generate_embeddings(embedder: Embeddings): Creates embeddings for each document chunk using a specified embedding model. The embeddings are stored in `self.embeddings`.
-
-        store_in_db(collection: Collection): Stores the chunks and their corresponding embeddings as data objects in the specified database collection.
-        
-        process_document(embedder: Embeddings, client: WeaviateClient): Orchestrates the document processing workflow. Checks if the document already exists in the database. If not, it runs the full workflow: loading, splitting, embedding, and storing the data.
-    """
-    def __init__(self, doc_path: str, doc_id: str):
-        self.doc_path = doc_path
-        self.doc_id = doc_id
-
-    # ---------------------------------------------- #
-    def load_and_split(self):
-        loader = DoclingLoader(
-        converter=doc_converter,
-        file_path=self.doc_path,
-        export_type=ExportType.DOC_CHUNKS,
-        chunker=HybridChunker(tokenizer=EMBEDDING_MODEL_NAME, max_tokens= CHUNK_SIZE, merge_peers= True),
-        )
-        self.chunks = loader.load()
-    # ---------------------------------------------- #
-
-    def generate_embeddings(self, embedder: Embeddings):
-        self.embeddings = embedder.embed_documents([chunk.page_content for chunk in self.chunks])
-    # ---------------------------------------------- #
-    
-    def store_in_db(self, collection: Collection):        
-        objs = []
-        l1, l2 = (0, 0)
-        for i, chunk in enumerate(self.chunks):
-            if (i != 0) and (i % L1 == 0): l1 += 1
-            if (i != 0) and (i % L2 == 0): l2 += 1
-        
-            properties = {
-                "index": i,
-                "source_id": self.doc_id,
-                "page_no": get_page_nos(chunk),
-                "text": chunk.page_content,
-                "l1": l1,
-                "l2": l2
-            }
-            obj = wvc.data.DataObject(properties=properties, vector=self.embeddings[i])
-            objs.append(obj)
-
-        collection.data.insert_many(objs)
-    # ---------------------------------------------- #
-    
-    def process_document(self, embedder: Embeddings, client: WeaviateClient):
-        collection = client.collections.get(DB_NAME)   
-        exist_filter = id_filter(self.doc_id)
-        not_exist = (len((collection.query.fetch_objects(filters=exist_filter, limit=1).objects)) == 0)
-        if not_exist:
-            print(f"Processing document: {self.doc_path}")
-            self.load_and_split()
-            self.generate_embeddings(embedder)
-            self.store_in_db(collection)
-        else:
-            print(f"Document {self.doc_path} already exists in the database. Skipping processing.")
-        return
+from utils.config import *
+from utils.parent_index import get_parent_index
+from utils.instrumentation import stage
+from utils.helpers import get_page_nos, id_filter, uuids_filter, fetch_all, text_hash, file_hash, source_uuid, chunk_uuid, notify_source_change
+from utils.batch_writer import BatchWriter
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from weaviate import WeaviateClient
+from weaviate.collections import Collection
+import weaviate.classes as wvc
+
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import urlopen
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+# --------------------------------------------------------------------- #
+
+# -- Docling Factories -- #
+# Docling and its models are only loaded by processes that convert documents
+_converters = {}                   # One converter per table structure setting
+_chunkers = threading.local()      # One chunker (and tokenizer) per thread
+_docling_lock = threading.Lock()
+
+def get_converter(tables=True, table_mode=TABLE_MODE):
+    key = (tables, table_mode)
+    converter = _converters.get(key)
+    if (converter is None):
+        with _docling_lock:
+            converter = _converters.get(key)
+            if (converter is None):
+                from docling.datamodel.base_models import InputFormat
+                from docling.datamodel.pipeline_options import PdfPipelineOptions, TableFormerMode
+                from docling.document_converter import DocumentConverter, PdfFormatOption
+
+                pipeline_options = PdfPipelineOptions()
+                pipeline_options.do_ocr = False
+                pipeline_options.do_table_structure = tables
+                pipeline_options.table_structure_options.do_cell_matching = True
+                pipeline_options.table_structure_options.mode = TableFormerMode(table_mode)
+                converter = _converters[key] = DocumentConverter(
+                    format_options={
+                        InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options),
+                    }
+                )
+    return converter
+
+def get_chunker():
+    chunker = getattr(_chunkers, "chunker", None)
+    if (chunker is None):
+        from docling.chunking import HybridChunker
+        chunker = _chunkers.chunker = HybridChunker(tokenizer=EMBEDDING_MODEL_NAME, max_tokens= CHUNK_SIZE, merge_peers= True)
+    return chunker
+# --------------------------------------------------------------------- #
+
+# -- Document Helpers -- #
+def convert_document(doc_path: str, source: str = None, page_range: tuple[int, int] = None,
+                     tables=True, table_mode=TABLE_MODE) -> list[Document]:
+    # Same output as `DoclingLoader` with `ExportType.DOC_CHUNKS`, with conversion and chunking timed apart.
+    # `source` is a local copy of `doc_path` to read instead, and `page_range` limits conversion to the (first, last) pages.
+    options = {"page_range": page_range} if (page_range) else {}
+    with stage("document.convert", path=doc_path, page_range=page_range, tables=tables) as span:
+        dl_doc = get_converter(tables, table_mode).convert(source=source or doc_path, **options).document
+        if (span): span.set(pages=dl_doc.num_pages())
+
+    with stage("document.chunk", path=doc_path, page_range=page_range) as span:
+        from langchain_docling.loader import MetaExtractor
+
+        chunker = get_chunker()
+        meta_extractor = MetaExtractor()
+        chunks = [Document(page_content=chunker.contextualize(chunk=chunk),
+                           metadata=meta_extractor.extract_chunk_meta(file_path=doc_path, chunk=chunk))
+                  for chunk in chunker.chunk(dl_doc)]
+        if (span): span.set(chunks=len(chunks), bytes=sum(len(chunk.page_content.encode("utf-8")) for chunk in chunks))
+    return chunks
+
+def chunk_properties(chunk: Document, doc_id: str, index: int) -> dict:
+    return {
+        "index": index,
+        "source_id": doc_id,
+        "page_no": get_page_nos(chunk),
+        "text": chunk.page_content,
+        "l1": index // L1,
+        "l2": index // L2,
+        "content_hash": text_hash(chunk.page_content)
+    }
+
+def stored_file_hash(client: WeaviateClient, doc_id: str) -> str:
+    # None for documents stored with other auto-merge groups, so a change of `L1` / `L2` re-syncs them
+    manifest = client.collections.get(SOURCES_DB_NAME).query.fetch_object_by_id(source_uuid(doc_id))
+    if (manifest is None) or ((manifest.properties.get("l1"), manifest.properties.get("l2")) != (L1, L2)):
+        return None
+    return manifest.properties["file_hash"]
+
+def save_manifest(client: WeaviateClient, doc_id: str, doc_hash: str, chunks: int):
+    properties = {"source_id": doc_id, "file_hash": doc_hash, "chunks": chunks, "l1": L1, "l2": L2}
+    obj = wvc.data.DataObject(properties=properties, uuid=source_uuid(doc_id))
+    result = client.collections.get(SOURCES_DB_NAME).data.insert_many([obj])
+    if (result.has_errors):
+        # Without its manifest the document is not skipped next time, and the local index misses the change
+        raise RuntimeError(f"Saving the manifest of {doc_id} failed: {next(iter(result.errors.values())).message}")
+# --------------------------------------------------------------------- #
+
+# -- Page Shards -- #
+@contextmanager
+def local_copy(doc_path: str):
+    # Remote documents are downloaded once, so every shard (and the file hash) reads the same local file
+    if not (doc_path.startswith(("http://", "https://"))):
+        yield doc_path
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix=Path(urlparse(doc_path).path).suffix)
+    try:
+        with os.fdopen(fd, "wb") as f, urlopen(doc_path) as stream:
+            shutil.copyfileobj(stream, f)
+        yield tmp_path
+    finally:
+        os.remove(tmp_path)
+
+def page_count(path: str) -> int:
+    # 0 for anything but a PDF (those are never sharded)
+    if (Path(path).suffix.lower() != ".pdf"):
+        return 0
+    import pypdfium2
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def plan_shards(path: str, tables=True, table_pages=None, shard_pages=SHARD_PAGES, min_pages=SHARD_MIN_PAGES) -> list[tuple]:
+    """
+    Splits a document into (page_range, tables) conversion shards.
+
+    PDFs of at least `min_pages` pages are cut into runs of at most `shard_pages` pages. When `table_pages` (1-based page numbers) is given, runs are also cut where table structure recognition is switched on or off, so it only runs on those pages, whatever the document size. Anything else is a single `(None, tables)` shard.
+    """
+    pages = page_count(path)
+    if (pages == 0) or ((pages < min_pages) and (table_pages is None)):
+        return [(None, tables)]
+    if (pages < min_pages):
+        shard_pages = pages
+
+    table_pages = set(table_pages) if (table_pages is not None) else None
+    flags = [(tables) and ((table_pages is None) or (page in table_pages)) for page in range(1, pages + 1)]
+    shards, start = [], 1
+    for page in range(2, pages + 2):
+        if (page > pages) or (flags[page - 1] != flags[start - 1]) or (page - start >= shard_pages):
+            shards.append(((start, page - 1), flags[start - 1]))
+            start = page
+    return shards
+
+def convert_sharded(doc_path: str, tables=True, table_pages=None, table_mode=TABLE_MODE,
+                    shard_pages=SHARD_PAGES, min_pages=SHARD_MIN_PAGES, workers=SHARD_WORKERS) -> list[Document]:
+    """
+    Converts and chunks a document, with large PDFs split into page shards converted in parallel in a process pool.
+
+    The chunks of every shard are concatenated in page order, so the global `index` (and the `l1` / `l2` groups derived from it) assigned by `chunk_properties` stays in document order, and `page_no` keeps the original page numbers. A chunk never spans two shards.
+    """
+    with local_copy(doc_path) as source:
+        shards = plan_shards(source, tables, table_pages, shard_pages, min_pages)
+        if (len(shards) == 1) or (workers <= 1):
+            return [chunk for page_range, do_tables in shards
+                    for chunk in convert_document(doc_path, source, page_range, do_tables, table_mode)]
+
+        context = multiprocessing.get_context("spawn")
+        with stage("document.convert_sharded", path=doc_path, shards=len(shards)):
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=context) as pool:
+                futures = [pool.submit(convert_document, doc_path, source, page_range, do_tables, table_mode)
+                           for page_range, do_tables in shards]
+                return [chunk for future in futures for chunk in future.result()]
+# --------------------------------------------------------------------- #
+
+# -- Document Class -- #
+class DocumentProcessor:
+    """
+    Processes and embeds documents for use in a RAG system.
+
+    This class handles the entire workflow of preparing a document for a retrieval-augmented generation (RAG) system. It loads a document, breaks it down into manageable chunks, generates vector embeddings for each chunk, and stores the data in a database.
+    
+    Attributes:
+        doc_path (str): The file path of the document to be processed.
+        doc_id (str): A unique identifier for the document.
+        tables (bool): Whether table structure recognition runs on the document.
+        table_pages (Set[int]): The only pages (1-based) table structure recognition runs on, or None for all pages.
+        table_mode (str): The table structure model, "accurate" or "fast".
+        file_hash (str): The SHA-256 hash of the document file.
+        chunks (List[str]): Stores the document chunks.
+        embeddings (List[List[float]]): Stores the generated embeddings.
+
+    Methods:
+        load_and_split(): Loads the document and splits it into chunks using a hybrid chunking strategy, converting large PDFs in parallel page shards. The resulting chunks are stored in `self.chunks`.
+
+        generate_embeddings(embedder: Embeddings): Creates embeddings for each document chunk using a specified embedding model. The embeddings are stored in `self.embeddings`.
+
+        store_in_db(collection: Collection, writer: BatchWriter = None): Streams the chunks and their corresponding embeddings as data objects into the specified database collection through a `BatchWriter`, under deterministic chunk UUIDs so retries and repeated runs never duplicate a chunk, and precomputes their auto-merge parent chunks in the local parent index. Raises `RuntimeError` when objects still fail after the writer's retries.
+
+        sync_with_db(collection: Collection, embedder: Embeddings, writer: BatchWriter = None): Diffs the current chunks against the stored ones by content hash. Only new or changed chunks are written (at their chunk UUIDs), vectors of known content are reused instead of re-embedded, and removed chunks, duplicates and changed chunks stored under older random UUIDs are deleted.
+        
+        process_document(embedder: Embeddings, client: WeaviateClient): Orchestrates the document processing workflow. Skips the document if its file hash and auto-merge group sizes match the stored ones. Otherwise it loads and splits the document, then stores it in full (new document) or syncs the changed chunks (existing document), and saves its manifest. Raises `RuntimeError` when the chunks or the manifest cannot be written.
+    """
+    def __init__(self, doc_path: str, doc_id: str, tables=True, table_pages=None, table_mode=TABLE_MODE):
+        self.doc_path = doc_path
+        self.doc_id = doc_id
+        self.tables = tables
+        self.table_pages = table_pages
+        self.table_mode = table_mode
+
+    # ---------------------------------------------- #
+    def load_and_split(self):
+        self.chunks = convert_sharded(self.doc_path, self.tables, self.table_pages, self.table_mode)
+    # ---------------------------------------------- #
+
+    def generate_embeddings(self, embedder: Embeddings):
+        with stage("document.embed", source_id=self.doc_id, chunks=len(self.chunks)):
+            self.embeddings = embedder.embed_documents([chunk.page_content for chunk in self.chunks])
+    # ---------------------------------------------- #
+    
+    def store_in_db(self, collection: Collection, writer: BatchWriter = None):
+        props = [chunk_properties(chunk, self.doc_id, i) for i, chunk in enumerate(self.chunks)]
+        objs = (wvc.data.DataObject(properties=properties, vector=vector, uuid=chunk_uuid(self.doc_id, properties["index"]))
+                for properties, vector in zip(props, self.embeddings))
+
+        report = (writer or BatchWriter(collection)).write(objs, source_id=self.doc_id, objects=len(props))
+        if (report["failed"]):
+            raise RuntimeError(f"Storing {self.doc_path} failed for {len(report['failed'])} objects: {report['failed'][0][1]}")
+        # Only a fully written document gets its parent index and invalidates the caches
+        get_parent_index().build(self.doc_id, props)
+        notify_source_change(self.doc_id)
+
+        print(f"Stored document {self.doc_path}: {report['written']} objects ({report['objects_per_second']} objects/s).")
+    # ---------------------------------------------- #
+    
+    def sync_with_db(self, collection: Collection, embedder: Embeddings, writer: BatchWriter = None):
+        stored = fetch_all(collection, id_filter(self.doc_id), return_properties=["index", "page_no", "l1", "l2", "content_hash"])
+        stored_by_index = {}
+        for obj in stored:
+            # An index stored twice keeps the object at its chunk UUID
+            index = obj.properties["index"]
+            if (index not in stored_by_index) or (str(obj.uuid) == chunk_uuid(self.doc_id, index)):
+                stored_by_index[index] = obj
+        new_props = [chunk_properties(chunk, self.doc_id, i) for i, chunk in enumerate(self.chunks)]
+
+        # Chunks whose content, pages or auto-merge groups changed
+        changed = []
+        for i, props in enumerate(new_props):
+            old = stored_by_index.get(i)
+            if (old is None) or any(old.properties.get(key) != props[key] for key in ("content_hash", "page_no", "l1", "l2")):
+                changed.append(i)
+
+        # Changed chunks are written at their chunk UUID. Unchanged objects are kept, every other stored one is removed:
+        # chunks past the new end, duplicates and changed chunks stored under an older random UUID
+        changed_set = set(changed)
+        kept = {obj.uuid for i, obj in stored_by_index.items() if (i < len(new_props)) and (i not in changed_set)}
+        removed = [obj.uuid for obj in stored
+                   if (obj.uuid not in kept) and not ((obj.properties["index"] < len(new_props)) and (str(obj.uuid) == chunk_uuid(self.doc_id, obj.properties["index"])))]
+
+        # Reuse the stored vectors of known content
+        stored_by_hash = {obj.properties["content_hash"]: obj.uuid for obj in stored if (obj.properties.get("content_hash"))}
+        reuse_uuids = list({stored_by_hash[new_props[i]["content_hash"]] for i in changed if (new_props[i]["content_hash"] in stored_by_hash)})
+        vectors = {}
+        if (reuse_uuids):
+            for obj in fetch_all(collection, uuids_filter(reuse_uuids), return_properties=["content_hash"], include_vector=True):
+                vectors[obj.properties["content_hash"]] = obj.vector["default"]
+
+        # Embed the new content only
+        to_embed = list({new_props[i]["content_hash"]: i for i in changed if (new_props[i]["content_hash"] not in vectors)}.values())
+        if (to_embed):
+            with stage("document.embed", source_id=self.doc_id, chunks=len(to_embed)):
+                embeddings = embedder.embed_documents([new_props[i]["text"] for i in to_embed])
+            for i, embedding in zip(to_embed, embeddings):
+                vectors[new_props[i]["content_hash"]] = embedding
+
+        # Overwrite changed chunks in place, add new ones, then delete removed ones
+        objs = (wvc.data.DataObject(properties=new_props[i], vector=vectors[new_props[i]["content_hash"]], uuid=chunk_uuid(self.doc_id, i))
+                for i in changed)
+        report = (writer or BatchWriter(collection)).write(objs, source_id=self.doc_id, objects=len(changed)) if (changed) else {"failed": []}
+        if (report["failed"]):
+            notify_source_change(self.doc_id)
+            raise RuntimeError(f"Syncing {self.doc_path} failed for {len(report['failed'])} objects: {report['failed'][0][1]}")
+        if (removed):
+            with stage("document.delete", source_id=self.doc_id, objects=len(removed)):
+                collection.data.delete_many(where=uuids_filter(removed))
+        get_parent_index().build(self.doc_id, new_props)
+        notify_source_change(self.doc_id)
+
+        print(f"Synced document {self.doc_path}: {len(new_props) - len(changed)} unchanged, "
+              f"{len(changed)} written ({len(to_embed)} embedded), {len(removed)} removed.")
+    # ---------------------------------------------- #
+    
+    def process_document(self, embedder: Embeddings, client: WeaviateClient):
+        collection = client.collections.get(DB_NAME)   
+        self.file_hash = file_hash(self.doc_path)
+        if (stored_file_hash(client, self.doc_id) == self.file_hash):
+            print(f"Document {self.doc_path} already exists in the database. Skipping processing.")
+            return
+
+        print(f"Processing document: {self.doc_path}")
+        self.load_and_split()
+
+        exist_filter = id_filter(self.doc_id)
+        not_exist = (len((collection.query.fetch_objects(filters=exist_filter, limit=1).objects)) == 0)
+        if not_exist:
+            self.generate_embeddings(embedder)
+            self.store_in_db(collection)
+        else:
+            self.sync_with_db(collection, embedder)
+
+        save_manifest(client, self.doc_id, self.file_hash, len(self.chunks))
+        return
 # --------------------------------------------------------------------- #
\ No newline at end of file
@@ -1,20 +1,145 @@
-# Utils
-from utils.config import *
-from langchain_core.embeddings import Embeddings
-from sentence_transformers import SentenceTransformer
-# ===================================================================== #
-
-# HFEmbedding Model
-class Embedding(Embeddings):
-    def __init__(self, model_name=EMBEDDING_MODEL_NAME,
-                prompt=REPRESENTATION_PROMPT):
-        self.model = SentenceTransformer(model_name, trust_remote_code=True).cuda()
-        self.prompt = prompt
-
-    def embed_documents(self, texts: list[str]):
-        return self.model.encode(texts).tolist()
-
-    def embed_query(self, text: str):
-        text = self.prompt + text if (self.prompt) else text
-        return self.model.encode(text).squeeze().tolist()
-# --------------------------------------------------------------------- #
\ No newline at end of file
+# Utils
+from utils.config import *
+from utils.helpers import get_device, truncate_embeddings
+import threading
+import numpy as np
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+# ===================================================================== #
+
+# HFEmbedding Model
+class Embedding(Embeddings):
+    """
+    Sentence-Transformers embedding model for documents and queries.
+
+    Attributes:
+        model (SentenceTransformer): The embedding model, placed on the selected device (loaded on first access).
+        device (str): The device the model runs on. Selected automatically (cuda / mps / cpu) when the model is loaded if not given.
+        prompt (str): The representation prompt prepended to queries.
+        batch_size (int): The number of texts encoded per forward pass.
+        dimensions (int): The Matryoshka truncation dimension applied to documents and queries alike (None keeps the model dimension).
+        as_numpy (bool): Whether embeddings are returned as float32 NumPy arrays instead of Python lists.
+        cache_hits (int): The number of `embed_query` calls served from the query cache.
+        cache_misses (int): The number of `embed_query` calls that ran the model.
+
+    Methods:
+        embed_documents(texts: List[str]) -> List[List[float]] | np.ndarray:
+            Embeds document chunks in batches of `batch_size`.
+
+        embed_query(text: str) -> List[float] | np.ndarray:
+            Embeds a query with the representation prompt applied. Results are kept in a bounded LRU cache keyed on the prompted text.
+
+        embed_queries(texts: List[str]) -> List[List[float]] | np.ndarray:
+            Embeds several queries, encoding the ones missing from the query cache in a single batch.
+
+        clear_cache():
+            Empties the query cache and resets its counters.
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME,
+                prompt=REPRESENTATION_PROMPT, device=EMBEDDING_DEVICE,
+                batch_size=EMBEDDING_BATCH_SIZE, dimensions=EMBEDDING_DIMENSIONS,
+                as_numpy=False, cache_size=QUERY_CACHE_SIZE, model=None):
+        self.model_name = model_name
+        self.device = device
+        self._model = model
+        self._model_lock = threading.Lock()
+        self.prompt = prompt
+        self.batch_size = batch_size
+        self.dimensions = dimensions
+        self.as_numpy = as_numpy
+
+        # Query Cache
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    # -- Model -- #
+    @property
+    def model(self):
+        if (self._model is None):
+            with self._model_lock:
+                if (self._model is None):
+                    self._model = self.load_model()
+        return self._model
+
+    def load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        self.device = get_device(self.device)
+        return SentenceTransformer(self.model_name, device=self.device, trust_remote_code=True)
+    # --------------------------------------------------------------------- #
+
+    def encode(self, texts):
+        embeddings = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                       show_progress_bar=False).astype("float32", copy=False)
+        return truncate_embeddings(embeddings, self.dimensions)
+
+    def embed_documents(self, texts: list[str]):
+        embeddings = self.encode(texts)
+        return embeddings if (self.as_numpy) else embeddings.tolist()
+
+    def embed_query(self, text: str):
+        text = self.prompt + text if (self.prompt) else text
+
+        embedding = self._cache_get(text)
+        if (embedding is None):
+            embedding = self.encode([text])[0]
+            self._cache_put(text, embedding)
+        return embedding.copy() if (self.as_numpy) else embedding.tolist()
+
+    def embed_queries(self, texts: list[str]):
+        texts = [self.prompt + text if (self.prompt) else text for text in texts]
+
+        embeddings = [self._cache_get(text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if (embedding is None)]
+        if (missing):
+            for i, embedding in zip(missing, self.encode([texts[i] for i in missing])):
+                embeddings[i] = embedding
+                self._cache_put(texts[i], embedding)
+
+        if (self.as_numpy):
+            return np.stack(embeddings) if (embeddings) else np.empty((0, 0), dtype=np.float32)
+        return [embedding.tolist() for embedding in embeddings]
+    # --------------------------------------------------------------------- #
+
+    # -- Query Cache -- #
+    def _cache_get(self, key: str):
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if (embedding is None):
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+                self._cache.move_to_end(key)
+            return embedding
+
+    def _cache_put(self, key: str, embedding):
+        if (self.cache_size <= 0):
+            return
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while (len(self._cache) > self.cache_size):
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
+# --------------------------------------------------------------------- #
+
+# -- Shared Instance -- #
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder() -> Embedding:
+    global _embedder
+    if (_embedder is None):
+        with _embedder_lock:
+            if (_embedder is None):
+                _embedder = Embedding()
+    return _embedder
+# --------------------------------------------------------------------- #
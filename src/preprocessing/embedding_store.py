@@ -0,0 +1,193 @@
+# Utils
+from utils.config import *
+from utils.helpers import text_hash
+import re
+import time
+import sqlite3
+import threading
+import numpy as np
+from pathlib import Path
+from langchain_core.embeddings import Embeddings
+# ===================================================================== #
+
+# -- On-Disk Embedding Store -- #
+class EmbeddingStore:
+    """
+    Persistent embedding cache keyed by model name, embedding dimension and chunk-text hash.
+
+    Vectors are kept in a memory-mapped float32 matrix (`vectors.f32`) and located through a SQLite hash index (`index.sqlite`), both stored under a directory named after the embedding model and its truncation dimension. The matrix grows on demand up to `max_entries` rows; once full, the least recently used entries are evicted and their rows reused.
+
+    Attributes:
+        path (Path): The store directory of the embedding model and dimension.
+        max_entries (int): The maximum number of cached vectors.
+        dim (int): The vector dimension (known after the first write).
+
+    Methods:
+        get_many(keys: List[str]) -> Dict[str, np.ndarray]:
+            Returns the cached vectors found for the given keys and marks them as recently used.
+
+        put_many(items: Dict[str, np.ndarray]):
+            Stores vectors, evicting the least recently used entries if the store is full.
+
+        __len__() -> int:
+            Returns the number of cached vectors.
+    """
+    def __init__(self, path=EMBEDDING_STORE_PATH, model_name=EMBEDDING_MODEL_NAME,
+                dimensions=EMBEDDING_DIMENSIONS, max_entries=EMBEDDING_STORE_MAX_ENTRIES):
+        model_dir = re.sub(r"[^\w.-]+", "__", model_name) + (f"__{dimensions}d" if (dimensions) else "")
+        self.path = Path(path) / model_dir
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self.db = sqlite3.connect(self.path / "index.sqlite", check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER, last_used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.commit()
+
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = row[0] if (row) else None
+        self.vectors = None
+        if (self.dim):
+            self._open(self._file_rows())
+    # ---------------------------------------------- #
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    # ---------------------------------------------- #
+
+    # -- Main Methods -- #
+    def get_many(self, keys: list[str]) -> dict:
+        if not (keys) or (self.dim is None):
+            return {}
+        with self._lock:
+            slots = self._lookup(keys)
+            self.db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(time.time(), key) for key in slots])
+            self.db.commit()
+            return {key: np.array(self.vectors[slot]) for key, slot in slots.items()}
+    # ---------------------------------------------- #
+
+    def put_many(self, items: dict):
+        if not (items):
+            return
+        with self._lock:
+            if (self.dim is None):
+                self.dim = len(next(iter(items.values())))
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (self.dim,))
+
+            # Known keys already hold the same vector, allocate slots for the others
+            keys = list(items)
+            known = self._lookup(keys)
+            new_keys = [key for key in keys if (key not in known)][:self.max_entries]
+            slots = dict(zip(new_keys, self._allocate(len(new_keys))))
+
+            now = time.time()
+            for key, slot in slots.items():
+                self.vectors[slot] = np.asarray(items[key], dtype=np.float32)
+            self.vectors.flush()
+
+            self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                [(key, slot, now) for key, slot in slots.items()])
+            self.db.commit()
+    # ---------------------------------------------- #
+
+    # -- Storage Helpers -- #
+    def _lookup(self, keys: list[str]) -> dict:
+        slots = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            query = f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})"
+            slots.update(self.db.execute(query, part).fetchall())
+        return slots
+    # ---------------------------------------------- #
+
+    def _allocate(self, n: int) -> list[int]:
+        # Live slots are always 0..used-1; a store reopened with a smaller `max_entries` may hold more than it
+        used = len(self)
+        free = max(0, min(n, self.max_entries - used))
+        slots = list(range(used, used + free))
+
+        # Evict the least recently used entries for the rest
+        if (free < n):
+            evicted = self.db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (n - free,)).fetchall()
+            self.db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+            slots.extend(slot for _, slot in evicted)
+
+        if (self.vectors is None) or (slots and max(slots) >= len(self.vectors)):
+            rows = min(self.max_entries, max(used + free, 2 * (0 if (self.vectors is None) else len(self.vectors)), 1024))
+            self._open(max(rows, max(slots) + 1))
+        return slots
+    # ---------------------------------------------- #
+
+    def _file_rows(self) -> int:
+        file = self.path / "vectors.f32"
+        return (file.stat().st_size // (4 * self.dim)) if (file.exists()) else 0
+    # ---------------------------------------------- #
+
+    def _open(self, rows: int):
+        # Never shrinks the matrix below the highest live slot
+        last = self.db.execute("SELECT MAX(slot) FROM entries").fetchone()[0]
+        rows = max(rows, (last + 1) if (last is not None) else 0)
+        file = self.path / "vectors.f32"
+        if (self.vectors is not None):
+            self.vectors.flush()
+            del self.vectors
+        with open(file, "ab") as f:
+            f.truncate(max(rows, 1) * self.dim * 4)
+        self.vectors = np.memmap(file, dtype=np.float32, mode="r+", shape=(max(rows, 1), self.dim))
+# ===================================================================== #
+
+# -- Cached Embedding Model -- #
+class CachedEmbedding(Embeddings):
+    """
+    Embedding model wrapper that serves known chunks from an `EmbeddingStore`.
+
+    Attributes:
+        embedder (Embeddings): The wrapped embedding model.
+        store (EmbeddingStore): The on-disk embedding store.
+        hits (int): The number of chunks served from the store.
+        misses (int): The number of chunks embedded by the model.
+
+    Methods:
+        embed_documents(texts: List[str]) -> List[List[float]] | np.ndarray:
+            Looks up every chunk by its text hash, embeds only the missing ones and stores them.
+
+        embed_query(text: str) -> List[float] | np.ndarray:
+            Delegates to the wrapped model (queries have their own in-memory cache).
+
+        embed_queries(texts: List[str]) -> List[List[float]] | np.ndarray:
+            Delegates to the wrapped model, batching the queries when it supports it.
+    """
+    def __init__(self, embedder: Embeddings, store: EmbeddingStore = None):
+        self.embedder = embedder
+        # The default store is the one of the wrapped model and its truncation dimension
+        self.store = store if (store is not None) else EmbeddingStore(model_name=getattr(embedder, "model_name", EMBEDDING_MODEL_NAME),
+                                                                      dimensions=getattr(embedder, "dimensions", EMBEDDING_DIMENSIONS))
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: list[str]):
+        keys = [text_hash(text) for text in texts]
+        vectors = self.store.get_many(list(set(keys)))
+
+        missing = {key: text for key, text in zip(keys, texts) if (key not in vectors)}
+        if (missing):
+            embeddings = self.embedder.embed_documents(list(missing.values()))
+            new_vectors = {key: np.asarray(embedding, dtype=np.float32) for key, embedding in zip(missing, embeddings)}
+            self.store.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        embeddings = np.stack([vectors[key] for key in keys]) if (keys) else np.empty((0, self.store.dim or 0), dtype=np.float32)
+        return embeddings if (getattr(self.embedder, "as_numpy", False)) else embeddings.tolist()
+
+    def embed_query(self, text: str):
+        return self.embedder.embed_query(text)
+
+    def embed_queries(self, texts: list[str]):
+        if (hasattr(self.embedder, "embed_queries")):
+            return self.embedder.embed_queries(texts)
+        return [self.embedder.embed_query(text) for text in texts]
+# --------------------------------------------------------------------- #
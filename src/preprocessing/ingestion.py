@@ -0,0 +1,316 @@
+# Utils
+from utils.config import *
+from utils.helpers import id_filter, file_hash, chunk_uuid, notify_source_change
+from utils.batch_writer import BatchWriter
+from utils.parent_index import get_parent_index
+from utils.instrumentation import stage
+from preprocessing.document import DocumentProcessor, convert_document, chunk_properties, stored_file_hash, save_manifest, local_copy, plan_shards
+import json
+import time
+import threading
+import multiprocessing
+from pathlib import Path
+from queue import Queue
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from langchain_core.embeddings import Embeddings
+from weaviate import WeaviateClient
+import weaviate.classes as wvc
+# ===================================================================== #
+
+# -- Stage Statistics -- #
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.seconds += seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.seconds, 3),
+            "items_per_second": round(self.items / self.seconds, 2) if (self.seconds) else 0.0
+        }
+# --------------------------------------------------------------------- #
+
+# -- Bulk Ingestion -- #
+_DONE = object()
+
+class BulkIngester:
+    """
+    Pipelined ingestion of many documents into the vector store.
+
+    The `BulkIngester` class runs the load, chunk, embed and store steps of `DocumentProcessor` as three concurrent stages connected by bounded queues: Docling conversion in a process pool (large PDFs split into page shards that convert in parallel and are stitched back in order), embedding in micro-batches that span document boundaries, and streaming batched writes of every micro-batch through a `BatchWriter` (retrying failed objects under deterministic chunk UUIDs, so a resumed run never duplicates chunks). The CPU, the embedding model and the database are kept busy at the same time, and completed documents are recorded in a checkpoint file so a failed run can be resumed. Documents whose file hash matches the stored one are skipped before conversion, and changed documents already in the database are synced chunk by chunk like `DocumentProcessor.sync_with_db`.
+
+    Attributes:
+        embedder (Embeddings): The embedding model used for the chunks.
+        client (WeaviateClient): The Weaviate client instance.
+        collection: The collection object retrieved from the Weaviate client.
+        workers (int): The number of processes used for document conversion.
+        embed_batch_size (int): The number of chunks embedded per micro-batch.
+        queue_size (int): The capacity of the queues between stages.
+        checkpoint_path (str): The file recording completed document ids (optional).
+        table_options (Dict[str, dict]): Per document id, the `tables`, `table_pages` and `table_mode` conversion options of `DocumentProcessor` (optional).
+        stats (Dict[str, StageStats]): Per-stage item counts, busy time and throughput.
+        writer (BatchWriter): The writer of the write stage.
+
+    Methods:
+        collect_sources(sources: str | List[str] | Dict[str, str]) -> List[Tuple[str, str]]:
+            Resolves a directory, a list of paths or a `{path: doc_id}` mapping into (path, doc_id) pairs. Document ids default to the file name without extension.
+
+        ingest(sources: str | List[str] | Dict[str, str]) -> dict:
+            Runs the pipeline over the sources, skipping unchanged documents and documents in the checkpoint, and returns a throughput report.
+    """
+    def __init__(self, embedder: Embeddings, client: WeaviateClient,
+                workers=INGEST_WORKERS, embed_batch_size=INGEST_EMBED_BATCH_SIZE, queue_size=INGEST_QUEUE_SIZE,
+                checkpoint_path: str = None, table_options: dict = None):
+        self.embedder = embedder
+        self.client = client
+        self.collection = client.collections.get(DB_NAME)
+        self.workers = workers
+        self.embed_batch_size = embed_batch_size
+        self.queue_size = queue_size
+        self.checkpoint_path = checkpoint_path
+        self.table_options = table_options or {}
+        self.completed = self.load_checkpoint()
+        self.failed = {}
+        self.stats = {name: StageStats(name) for name in ("convert", "embed", "write")}
+        # Batch state is held per collection handle, so the write stage gets its own
+        self.writer = BatchWriter(client.collections.get(DB_NAME))
+        self._error = None
+    # ---------------------------------------------- #
+
+    # -- Sources & Checkpoint -- #
+    def collect_sources(self, sources) -> list[tuple[str, str]]:
+        if (isinstance(sources, dict)):
+            return list(sources.items())
+        if (isinstance(sources, (str, Path))) and (Path(sources).is_dir()):
+            sources = sorted(str(p) for p in Path(sources).rglob("*") if (p.suffix.lower() in INGEST_EXTENSIONS))
+        elif (isinstance(sources, (str, Path))):
+            sources = [str(sources)]
+        return [(str(path), Path(path).stem) for path in sources]
+    # ---------------------------------------------- #
+
+    def load_checkpoint(self) -> set:
+        if (self.checkpoint_path) and (Path(self.checkpoint_path).exists()):
+            with open(self.checkpoint_path) as f:
+                return set(json.load(f)["completed"])
+        return set()
+    # ---------------------------------------------- #
+
+    def save_checkpoint(self):
+        if not (self.checkpoint_path):
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"completed": sorted(self.completed), "failed": self.failed}, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+    # ---------------------------------------------- #
+
+    def exists(self, doc_id: str) -> bool:
+        return len(self.collection.query.fetch_objects(filters=id_filter(doc_id), limit=1).objects) > 0
+    # ---------------------------------------------- #
+
+    # -- Pipeline -- #
+    def ingest(self, sources) -> dict:
+        start = time.perf_counter()
+        # Failures are per run: a document that failed before is retried and checkpointed when it succeeds
+        self.failed = {}
+        self._error = None
+        sources = [(path, doc_id) for path, doc_id in self.collect_sources(sources) if (doc_id not in self.completed)]
+
+        chunk_queue = Queue(maxsize=self.queue_size)
+        write_queue = Queue(maxsize=self.queue_size)
+        stages = [
+            threading.Thread(target=self._guard, args=(self.convert_stage, sources, chunk_queue), name="ingest-convert"),
+            threading.Thread(target=self._guard, args=(self.embed_stage, chunk_queue, write_queue), name="ingest-embed"),
+            threading.Thread(target=self._guard, args=(self.write_stage, write_queue, None), name="ingest-write"),
+        ]
+        for stage in stages: stage.start()
+        for stage in stages: stage.join()
+
+        if (self._error is not None):
+            raise self._error
+        return self.report(time.perf_counter() - start)
+    # ---------------------------------------------- #
+
+    def report(self, seconds: float) -> dict:
+        return {
+            "documents": len(self.completed),
+            "failed": self.failed,
+            "wall_seconds": round(seconds, 3),
+            "stages": {name: stats.as_dict() for name, stats in self.stats.items()},
+            "writes": self.writer.stats | {"objects_per_second": round(self.writer.throughput(), 2)}
+        }
+    # ---------------------------------------------- #
+
+    def _guard(self, stage, inbox, outbox):
+        try:
+            stage(inbox, outbox) if (outbox is not None) else stage(inbox)
+        except Exception as e:
+            self._error = self._error or e
+            if (outbox is not None):
+                outbox.put(_DONE)
+            # Keep draining so the upstream stages never block on a full queue
+            if (isinstance(inbox, Queue)):
+                while (inbox.get() is not _DONE):
+                    pass
+    # ---------------------------------------------- #
+
+    # -- Stage 1: Convert & Chunk -- #
+    def convert_stage(self, sources: list[tuple[str, str]], chunk_queue: Queue):
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool, ExitStack() as downloads:
+            pending = {}
+            sources = iter(sources)
+            while True:
+                # Keep a bounded number of conversions in flight
+                while (len(pending) < self.workers * 2) and (self._error is None):
+                    source = next(sources, None)
+                    if (source is None):
+                        break
+                    path, doc_id = source
+                    files = downloads.enter_context(ExitStack())
+                    try:
+                        local = files.enter_context(local_copy(path))
+                        doc_hash = file_hash(local)
+                        if (stored_file_hash(self.client, doc_id) == doc_hash):
+                            print(f"Document {path} already exists in the database. Skipping processing.")
+                            files.close()
+                            continue
+
+                        # Large PDFs are converted as page shards spread over the pool
+                        options = self.table_options.get(doc_id, {})
+                        table_mode = options.get("table_mode", TABLE_MODE)
+                        shards = plan_shards(local, options.get("tables", True), options.get("table_pages"))
+                    except Exception as e:
+                        # An unreadable or unreachable document fails alone; the others go on
+                        print(f"Failed to prepare {path}: {e}")
+                        self.failed[doc_id] = str(e)
+                        files.close()
+                        continue
+
+                    job = {"path": path, "doc_id": doc_id, "doc_hash": doc_hash, "files": files, "submitted": time.perf_counter(),
+                           "parts": [None] * len(shards), "remaining": len(shards), "error": None}
+                    for i, (page_range, do_tables) in enumerate(shards):
+                        future = pool.submit(convert_document, path, local, page_range, do_tables, table_mode)
+                        pending[future] = (job, i)
+
+                if not (pending):
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, i = pending.pop(future)
+                    try:
+                        job["parts"][i] = future.result()
+                    except Exception as e:
+                        job["error"] = job["error"] or e
+                    job["remaining"] -= 1
+                    if (job["remaining"] == 0):
+                        self._finish_conversion(job, chunk_queue)
+
+        chunk_queue.put(_DONE)
+    # ---------------------------------------------- #
+
+    def _finish_conversion(self, job: dict, chunk_queue: Queue):
+        job["files"].close()
+        if (job["error"] is not None):
+            print(f"Failed to convert {job['path']}: {job['error']}")
+            self.failed[job["doc_id"]] = str(job["error"])
+            return
+        # Shards are stitched in page order, so chunk indices follow the document
+        chunks = [chunk for part in job["parts"] for chunk in part]
+        self.stats["convert"].add(1, time.perf_counter() - job["submitted"])
+        chunk_queue.put((job["path"], job["doc_id"], job["doc_hash"], chunks))
+    # ---------------------------------------------- #
+
+    # -- Stage 2: Embed (micro-batches across documents) -- #
+    def embed_stage(self, chunk_queue: Queue, write_queue: Queue):
+        batch, finished = [], []
+        while True:
+            item = chunk_queue.get()
+            if (item is _DONE):
+                break
+
+            path, doc_id, doc_hash, chunks = item
+            if (self.exists(doc_id)):
+                # Changed document: re-embed and write only its changed chunks
+                start = time.perf_counter()
+                doc = DocumentProcessor(path, doc_id)
+                doc.chunks = chunks
+                try:
+                    doc.sync_with_db(self.collection, self.embedder)
+                except RuntimeError as e:
+                    print(e)
+                    self.failed[doc_id] = str(e)
+                self.stats["embed"].add(len(chunks), time.perf_counter() - start)
+                finished.append((doc_id, doc_hash, len(chunks)))
+                continue
+
+            doc_props = [chunk_properties(chunk, doc_id, i) for i, chunk in enumerate(chunks)]
+            get_parent_index().build(doc_id, doc_props)
+            for props in doc_props:
+                batch.append(props)
+                if (len(batch) >= self.embed_batch_size):
+                    self._embed_batch(batch, finished, write_queue)
+                    batch, finished = [], []
+            finished.append((doc_id, doc_hash, len(chunks)))
+
+        self._embed_batch(batch, finished, write_queue)
+        write_queue.put(_DONE)
+    # ---------------------------------------------- #
+
+    def _embed_batch(self, batch: list[dict], finished: list[tuple], write_queue: Queue):
+        if (batch):
+            start = time.perf_counter()
+            with stage("document.embed", chunks=len(batch)):
+                vectors = self.embedder.embed_documents([props["text"] for props in batch])
+            self.stats["embed"].add(len(batch), time.perf_counter() - start)
+            write_queue.put((batch, vectors))
+
+        # Mark the end of the documents whose chunks are all queued
+        for doc in finished:
+            write_queue.put((doc, None))
+    # ---------------------------------------------- #
+
+    # -- Stage 3: Write -- #
+    def write_stage(self, write_queue: Queue):
+        while True:
+            item = write_queue.get()
+            if (item is _DONE):
+                break
+
+            batch, vectors = item
+            if (vectors is None):
+                # End of document: all of its objects are written
+                doc_id, doc_hash, chunks = batch
+                if (doc_id not in self.failed):
+                    try:
+                        save_manifest(self.client, doc_id, doc_hash, chunks)
+                        self.completed.add(doc_id)
+                    except RuntimeError as e:
+                        print(e)
+                        self.failed[doc_id] = str(e)
+                notify_source_change(doc_id)
+                self.save_checkpoint()
+                continue
+
+            start = time.perf_counter()
+            uuids = [chunk_uuid(props["source_id"], props["index"]) for props in batch]
+            objs = (wvc.data.DataObject(properties=props, vector=vector, uuid=uuid) for props, vector, uuid in zip(batch, vectors, uuids))
+            report = self.writer.write(objs, objects=len(batch))
+            self.stats["write"].add(report["written"], time.perf_counter() - start)
+
+            # Objects still failing after the retries fail their document
+            sources = dict(zip(uuids, (props["source_id"] for props in batch)))
+            for uuid, message in report["failed"]:
+                self.failed[sources[uuid]] = message
+    # ---------------------------------------------- #
@@ -1 +1 @@
-__all__ = ['weaviate_retriever']
\ No newline at end of file
+__all__ = ['weaviate_retriever', 'reranker', 'semantic_cache', 'mmr', 'local_index']
\ No newline at end of file
@@ -0,0 +1,299 @@
+# Utils
+from utils.config import *
+from utils.helpers import id_filter, fetch_all, source_uuid, add_source_listener
+from utils.instrumentation import stage
+import math
+import time
+import uuid
+import shutil
+import weakref
+import tempfile
+import threading
+import numpy as np
+from pathlib import Path
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from weaviate.collections.classes.internal import Object, MetadataReturn
+# ================================================== #
+
+def tokenize(text: str) -> list[str]:
+    # Same as the collection's LOWERCASE tokenization of "text"
+    return text.lower().split()
+
+def normalize_scores(scores: np.ndarray) -> np.ndarray:
+    # Min-max normalization of relative score fusion
+    low, high = scores.min(), scores.max()
+    return (scores - low) / (high - low) if (high > low) else np.zeros_like(scores)
+# -------------------------------------------------- #
+
+class _Source:
+    """
+    The loaded chunks of one source: properties, a memory-mapped matrix of unit vectors and a BM25 inverted index.
+    """
+    __slots__ = ("source_id", "uuids", "properties", "vectors", "postings", "lengths", "total_length", "file", "manifest", "checked")
+
+    def __init__(self, source_id: str, objects: list, directory: str, manifest: dict = None):
+        self.source_id = source_id
+        self.manifest = manifest            # The source's manifest row when it was loaded
+        self.checked = time.monotonic()     # When it was last compared against the stored manifest
+        self.uuids = [obj.uuid for obj in objects]
+        self.properties = [obj.properties for obj in objects]
+        self.file = None
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        if (objects):
+            matrix = np.asarray([obj.vector["default"] for obj in objects], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self.file = str(Path(directory) / f"{uuid.uuid4().hex}.npy")
+            mapped = np.lib.format.open_memmap(self.file, mode="w+", dtype=np.float32, shape=matrix.shape)
+            mapped[:] = matrix / np.where(norms == 0, 1, norms)
+            mapped.flush()
+            del mapped
+            self.vectors = np.load(self.file, mmap_mode="r")
+
+        postings, lengths = {}, []
+        for i, props in enumerate(self.properties):
+            tokens = tokenize(props.get("text", ""))
+            lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(i)
+                postings[token][1].append(count)
+        self.postings = {token: (np.array(ids, dtype=np.int64), np.array(tfs, dtype=np.float32)) for token, (ids, tfs) in postings.items()}
+        self.lengths = np.array(lengths, dtype=np.float32)
+        self.total_length = float(sum(lengths))
+
+    def __len__(self) -> int:
+        return len(self.uuids)
+
+    def release(self):
+        # Only the file is unlinked: a running search may still hold this source, its arrays are freed with the last reference
+        if (self.file):
+            try:
+                os.remove(self.file)
+            except OSError:
+                pass    # Cannot be removed while mapped on some platforms, removed with the index directory
+            self.file = None
+# -------------------------------------------------- #
+
+class LocalIndex:
+    """
+    In-process hybrid index of hot sources.
+
+    The `LocalIndex` class serves hybrid searches over a small set of sources (e.g. the documents of one active course) without a database round trip. A source is loaded from the collection on its first search (or ahead of it with `prefetch`) into a memory-mapped matrix of unit vectors and a BM25 inverted index. Searches fuse the min-max normalized vector and keyword scores weighted by `alpha`, like Weaviate's relative score fusion. Sources are dropped when they are re-ingested or deleted in this process (and reloaded on their next search). Changes made by other processes are caught on the first search after `check_interval` seconds: the source is reloaded when its row in the sources manifest differs from the one it was loaded with (without a manifest collection, it is simply reloaded). The least recently used ones are evicted beyond `max_sources` sources or `max_objects` chunks.
+
+    BM25 statistics (document frequencies, average length) are computed over the searched sources rather than the whole collection, so keyword scores can differ slightly from Weaviate's.
+
+    Attributes:
+        collection: The collection sources are loaded from.
+        manifests: The sources manifest collection (`SOURCES_DB_NAME`) the loaded sources are checked against (optional).
+        check_interval (float): The seconds a loaded source is served before it is checked again.
+        sources (Set[str]): The sources served locally. Empty serves any search scoped to explicit `source_ids`.
+        max_sources (int): The maximum number of loaded sources.
+        max_objects (int): The maximum number of loaded chunks across all sources.
+        path (str): The directory of the memory-mapped vector files, removed when the index is closed.
+        k1 (float), b (float): The BM25 parameters.
+
+    Methods:
+        serves(source_ids: List[str]) -> bool:
+            Returns whether a search over `source_ids` is served locally.
+
+        search(query: str, query_emb: List[float], source_ids: List[str], k: int, alpha: float) -> List[Object]:
+            Returns the `k` best chunks of the sources by hybrid score (with `metadata.score`), loading the sources not yet loaded.
+
+        is_loaded(source_ids: List[str]) -> bool:
+            Returns whether all sources are loaded, i.e. a search will not touch the database.
+
+        prefetch(source_ids: List[str]) -> Future:
+            Loads the sources in a background thread.
+
+        on_source_change(source_id: str):
+            Drops a re-ingested or deleted source.
+
+        stats() -> dict:
+            Returns the loaded sources and chunks, and the load and eviction counts.
+
+        close():
+            Drops all sources and removes the vector files.
+    """
+    def __init__(self, collection, manifests=None, sources=LOCAL_INDEX_SOURCES, max_sources=LOCAL_INDEX_MAX_SOURCES,
+                 max_objects=LOCAL_INDEX_MAX_OBJECTS, check_interval=LOCAL_INDEX_CHECK_INTERVAL, path=LOCAL_INDEX_PATH, k1=1.2, b=0.75):
+        self.collection = collection
+        self.manifests = manifests
+        self.check_interval = check_interval
+        self.sources = set(sources or ())
+        self.max_sources = max_sources
+        self.max_objects = max_objects
+        self.k1 = k1
+        self.b = b
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="index-", dir=path)
+        self.loads = 0
+        self.evictions = 0
+        self._sources = OrderedDict()
+        self._versions = Counter()      # Bumped on every change, so a load racing a change is discarded
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-index")
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+        add_source_listener(self)
+    # -------------------------------------------------- #
+
+    # -- Main Methods -- #
+    def serves(self, source_ids: list[str]) -> bool:
+        return bool(source_ids) and ((not self.sources) or (self.sources.issuperset(source_ids)))
+    # -------------------------------------------------- #
+
+    def search(self, query: str, query_emb: list[float], source_ids: list[str], k: int, alpha: float) -> list[Object]:
+        with stage("retriever.local_hybrid", k=k, alpha=alpha) as span:
+            sources = [source for source in (self.get(source_id, keep=source_ids) for source_id in dict.fromkeys(source_ids)) if (len(source))]
+            if not (sources):
+                return []
+
+            query_emb = np.asarray(query_emb, dtype=np.float32)
+            query_emb = query_emb / (np.linalg.norm(query_emb) or 1)
+            vector_scores = np.concatenate([source.vectors @ query_emb for source in sources])
+            keyword_scores = self.bm25(query, sources)
+            scores = alpha * normalize_scores(vector_scores) + (1 - alpha) * normalize_scores(keyword_scores)
+
+            k = min(k, scores.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            objects = self.to_objects(sources, top, scores[top])
+            if (span): span.set(candidates=len(objects), sources=len(sources))
+        return objects
+    # -------------------------------------------------- #
+
+    def is_loaded(self, source_ids: list[str]) -> bool:
+        with self._lock:
+            return all(source_id in self._sources for source_id in source_ids)
+    # -------------------------------------------------- #
+
+    def prefetch(self, source_ids: list[str]) -> Future:
+        return self._loader.submit(lambda: [self.get(source_id, keep=source_ids) for source_id in source_ids])
+    # -------------------------------------------------- #
+
+    def on_source_change(self, source_id: str):
+        with self._lock:
+            self._versions[source_id] += 1
+            source = self._sources.pop(source_id, None)
+        if (source is not None):
+            source.release()
+    # -------------------------------------------------- #
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sources": len(self._sources), "objects": sum(len(source) for source in self._sources.values()),
+                    "loads": self.loads, "evictions": self.evictions}
+    # -------------------------------------------------- #
+
+    def close(self):
+        with self._lock:
+            sources = list(self._sources.values())
+            self._sources.clear()
+        for source in sources:
+            source.release()
+        self._loader.shutdown(wait=False)
+        self._finalizer()
+    # -------------------------------------------------- #
+
+    # -- Help Functions -- #
+    def get(self, source_id: str, keep=()) -> _Source:
+        with self._lock:
+            source = self._sources.get(source_id)
+            if (source is not None):
+                self._sources.move_to_end(source_id)
+        if (source is not None):
+            if (time.monotonic() - source.checked < self.check_interval) or (self.is_current(source)):
+                return source
+            # Changed by another process: load it again
+            self.on_source_change(source_id)
+
+        with self._load_lock:
+            while True:
+                with self._lock:
+                    source = self._sources.get(source_id)
+                    if (source is not None):
+                        return source
+                    version = self._versions[source_id]
+
+                with stage("retriever.local_load", source_id=source_id) as span:
+                    # The manifest is read first, so a change during the fetch is caught by the next check
+                    manifest = self.manifest(source_id)
+                    objects = fetch_all(self.collection, id_filter(source_id), include_vector=True)
+                    source = _Source(source_id, objects, self.path, manifest)
+                    if (span): span.set(objects=len(source))
+
+                with self._lock:
+                    if (self._versions[source_id] == version):
+                        self._sources[source_id] = source
+                        self.loads += 1
+                        evicted = self.evict(keep)
+                        break
+                # Changed while loading: load it again
+                source.release()
+
+        for stale in evicted:
+            stale.release()
+        return source
+    # -------------------------------------------------- #
+
+    def manifest(self, source_id: str) -> dict:
+        if (self.manifests is None):
+            return None
+        obj = self.manifests.query.fetch_object_by_id(source_uuid(source_id))
+        return dict(obj.properties) if (obj) else None
+    # -------------------------------------------------- #
+
+    def is_current(self, source: _Source) -> bool:
+        # Marked as checked first, so concurrent searches of the source do not all query the manifest
+        source.checked = time.monotonic()
+        if (self.manifests is None):
+            return False
+        return self.manifest(source.source_id) == source.manifest
+    # -------------------------------------------------- #
+
+    def evict(self, keep=()) -> list[_Source]:
+        # Called with `_lock` held, the least recently used sources go first
+        evicted, total = [], sum(len(source) for source in self._sources.values())
+        for source_id in list(self._sources):
+            if (len(self._sources) <= self.max_sources) and (total <= self.max_objects):
+                break
+            if (source_id in keep):
+                continue
+            source = self._sources.pop(source_id)
+            total -= len(source)
+            evicted.append(source)
+            self.evictions += 1
+        return evicted
+    # -------------------------------------------------- #
+
+    def bm25(self, query: str, sources: list[_Source]) -> np.ndarray:
+        offsets = np.cumsum([0] + [len(source) for source in sources])
+        scores = np.zeros(offsets[-1], dtype=np.float32)
+        average_length = sum(source.total_length for source in sources) / offsets[-1]
+        if not (average_length):
+            return scores
+
+        for token in set(tokenize(query)):
+            postings = [(offset, source, source.postings[token]) for offset, source in zip(offsets, sources) if (token in source.postings)]
+            frequency = sum(len(ids) for _, _, (ids, _) in postings)
+            if not (frequency):
+                continue
+            idf = math.log(1 + (offsets[-1] - frequency + 0.5) / (frequency + 0.5))
+            for offset, source, (ids, tf) in postings:
+                norm = self.k1 * (1 - self.b + self.b * source.lengths[ids] / average_length)
+                scores[offset + ids] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+    # -------------------------------------------------- #
+
+    @staticmethod
+    def to_objects(sources: list[_Source], rows: np.ndarray, scores: np.ndarray) -> list[Object]:
+        offsets = np.cumsum([0] + [len(source) for source in sources])
+        owners = np.searchsorted(offsets, rows, side="right") - 1
+        objects = []
+        for s, i, score in zip(owners.tolist(), (rows - offsets[owners]).tolist(), scores.tolist()):
+            objects.append(Object(uuid=sources[s].uuids[i], metadata=MetadataReturn(score=score),
+                                  properties=dict(sources[s].properties[i]), references=None, vector={},
+                                  collection=DB_NAME))
+        return objects
+# -------------------------------------------------- #
@@ -0,0 +1,42 @@
+# Utils
+import numpy as np
+# ================================================== #
+
+def maximal_marginal_relevance(query_emb, embeddings, k=5, lambda_mult=0.5) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Selects `k` rows of `embeddings` by maximal marginal relevance to `query_emb`.
+
+    The candidates are held in one contiguous float32 matrix. Query similarities are computed in one matrix-vector product, and the maximum similarity of every candidate to the selected rows is updated incrementally with one product per pick, so the cost is O(k * fetch_k * dim) with no Python loop over candidates.
+
+    Returns the selected row indices (in selection order) and their cosine similarity to the query.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if (matrix.ndim != 2) or (matrix.shape[0] == 0) or (k <= 0):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    # Cosine similarity as dot products of unit vectors
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    query = np.asarray(query_emb, dtype=np.float32)
+    relevance = matrix @ (query / (np.linalg.norm(query) or 1))
+
+    k = min(k, matrix.shape[0])
+    selected = np.empty(k, dtype=np.int64)
+    max_similarity = np.full(matrix.shape[0], -np.inf, dtype=np.float32)
+    available = np.ones(matrix.shape[0], dtype=bool)
+
+    # The first pick is the most relevant candidate
+    best = int(np.argmax(relevance))
+    for i in range(k):
+        selected[i] = best
+        available[best] = False
+        if (i == k - 1):
+            break
+
+        np.maximum(max_similarity, matrix @ matrix[best], out=max_similarity)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+
+    return selected, relevance[selected]
+# -------------------------------------------------- #
@@ -0,0 +1,174 @@
+# Utils
+from utils.config import *
+from utils.helpers import get_device
+import time
+import asyncio
+import threading
+from queue import Queue, Empty
+from concurrent.futures import Future
+# ================================================== #
+
+class Reranker:
+    """
+    Process-wide cross-encoder re-ranking service.
+
+    The `Reranker` class keeps a single cross-encoder model warm for the lifetime of the process. The model is loaded lazily on first use, and query-document pairs submitted by concurrent callers are collected by a background worker and scored together in shared forward passes.
+
+    Attributes:
+        model_name (str): The name of the cross-encoder model.
+        device (str): The device the model runs on ("cuda", "mps" or "cpu"). Selected automatically when not given.
+        max_batch_size (int): The maximum number of query-document pairs scored in one forward pass.
+        max_wait (float): The maximum time (in seconds) the worker waits for more requests before scoring a batch.
+        model: The loaded `CrossEncoder` model (loaded on first access).
+
+    Methods:
+        submit(pairs: List[Tuple[str, str]]) -> Future:
+            Queues query-document pairs for scoring and returns a future resolving to their scores.
+
+        score(pairs: List[Tuple[str, str]]) -> List[float]:
+            Scores query-document pairs, blocking until the batch containing them has been processed.
+
+        rank(query: str, documents: List[str], top_k: int) -> List[dict]:
+            Ranks documents against a query. Returns `{"corpus_id", "score"}` dictionaries sorted by score, like `CrossEncoder.rank`.
+
+        arank(query: str, documents: List[str], top_k: int) -> List[dict]:
+            Asynchronous version of `rank`; awaits the batch without blocking the event loop.
+    """
+    def __init__(self, model_name=RERANKER_MODEL_NAME, device=RERANKER_DEVICE,
+                max_batch_size=RERANKER_MAX_BATCH_SIZE, max_wait_ms=RERANKER_MAX_WAIT_MS, model=None):
+        self.model_name = model_name
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._model = model
+        self._lock = threading.Lock()
+        self._queue = Queue()
+        self._worker = None
+    # -------------------------------------------------- #
+
+    # -- Model -- #
+    @property
+    def model(self):
+        if (self._model is None):
+            with self._lock:
+                if (self._model is None):
+                    self._model = self.load_model()
+        return self._model
+    # -------------------------------------------------- #
+
+    def load_model(self):
+        from sentence_transformers import CrossEncoder
+
+        self.device = get_device(self.device)
+        kwargs = {}
+        if (self.device == "cpu"):
+            import torch
+            torch.set_num_threads(RERANKER_CPU_THREADS)
+            if (RERANKER_CPU_BACKEND != "torch"):
+                kwargs["backend"] = RERANKER_CPU_BACKEND
+
+        return CrossEncoder(self.model_name, device=self.device, trust_remote_code=True, **kwargs)
+    # -------------------------------------------------- #
+
+    # -- Main Methods -- #
+    def submit(self, pairs: list[tuple[str, str]]) -> Future:
+        future = Future()
+        if not (pairs):
+            future.set_result([])
+            return future
+
+        self._start_worker()
+        self._queue.put((pairs, future))
+        return future
+    # -------------------------------------------------- #
+
+    def score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        return self.submit(pairs).result()
+    # -------------------------------------------------- #
+
+    def rank(self, query: str, documents: list[str], top_k: int = None) -> list[dict]:
+        scores = self.score([(query, doc) for doc in documents])
+        return self.top_k(scores, top_k)
+    # -------------------------------------------------- #
+
+    async def arank(self, query: str, documents: list[str], top_k: int = None) -> list[dict]:
+        scores = await asyncio.wrap_future(self.submit([(query, doc) for doc in documents]))
+        return self.top_k(scores, top_k)
+    # -------------------------------------------------- #
+
+    @staticmethod
+    def top_k(scores: list[float], top_k: int = None) -> list[dict]:
+        indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
+        return [{"corpus_id": i, "score": scores[i]} for i in indices]
+    # -------------------------------------------------- #
+
+    # -- Batching Worker -- #
+    def _start_worker(self):
+        if (self._worker is not None) and (self._worker.is_alive()):
+            return
+        with self._lock:
+            if (self._worker is None) or not (self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name="reranker", daemon=True)
+                self._worker.start()
+    # -------------------------------------------------- #
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                request = self._queue.get()
+                if not (request[1].set_running_or_notify_cancel()):
+                    continue    # Cancelled while queued (e.g. its awaiting task was cancelled)
+                batch.append(request)
+                size = len(request[0])
+
+                # Collect concurrent requests until the batch is full or the wait time is over
+                deadline = time.monotonic() + self.max_wait
+                while (size < self.max_batch_size):
+                    timeout = deadline - time.monotonic()
+                    if (timeout <= 0):
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except Empty:
+                        break
+                    if (item[1].set_running_or_notify_cancel()):
+                        batch.append(item)
+                        size += len(item[0])
+
+                self._predict(batch)
+            except Exception as e:
+                # An unexpected error fails its batch, never the worker
+                self._fail(batch, e)
+    # -------------------------------------------------- #
+
+    def _predict(self, batch: list[tuple[list, Future]]):
+        pairs = [pair for request_pairs, _ in batch for pair in request_pairs]
+        scores = self.model.predict(pairs, batch_size=self.max_batch_size, show_progress_bar=False)
+        start = 0
+        for request_pairs, future in batch:
+            end = start + len(request_pairs)
+            if not (future.done()):
+                future.set_result([float(s) for s in scores[start:end]])
+            start = end
+    # -------------------------------------------------- #
+
+    @staticmethod
+    def _fail(batch: list[tuple[list, Future]], error: Exception):
+        for _, future in batch:
+            if not (future.done()):
+                future.set_exception(error)
+    # -------------------------------------------------- #
+
+# -- Shared Instance -- #
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker() -> Reranker:
+    global _reranker
+    if (_reranker is None):
+        with _reranker_lock:
+            if (_reranker is None):
+                _reranker = Reranker()
+    return _reranker
+# -------------------------------------------------- #
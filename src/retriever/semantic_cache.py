@@ -0,0 +1,249 @@
+# Utils
+from utils.config import *
+from utils.helpers import ids_filter, add_source_listener
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from langchain_core.documents import Document
+# ================================================== #
+
+class _Scope:
+    """
+    The unit query vectors of the entries in one scope, as the first `len(ids)` rows of a contiguous matrix grown by doubling.
+    """
+    __slots__ = ("matrix", "ids", "rows")
+
+    def __init__(self, dim: int):
+        self.matrix = np.empty((16, dim), dtype=np.float32)
+        self.ids = []       # Row -> entry id
+        self.rows = {}      # Entry id -> row
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, entry_id: int, vector: np.ndarray):
+        if (len(self.ids) == len(self.matrix)):
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+        self.matrix[len(self.ids)] = vector
+        self.rows[entry_id] = len(self.ids)
+        self.ids.append(entry_id)
+
+    def remove(self, entry_id: int):
+        # The last row moves into the freed one, so the live rows stay contiguous
+        row, last = self.rows.pop(entry_id), len(self.ids) - 1
+        if (row != last):
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            self.rows[self.ids[row]] = row
+        self.ids.pop()
+
+    def best(self, vector: np.ndarray) -> tuple[int, float]:
+        similarities = self.matrix[:len(self.ids)] @ vector
+        row = int(np.argmax(similarities))
+        return self.ids[row], float(similarities[row])
+# -------------------------------------------------- #
+
+class SemanticCache:
+    """
+    Semantic cache of retrieval results and answers keyed on query embeddings.
+
+    The `SemanticCache` class reuses the results of earlier queries whose embedding is close enough to a new query. Entries are scoped by the `source_ids` set and the search parameters, so a hit only happens for the same sources and settings. The query vectors of each scope are kept in one contiguous matrix, so a lookup is a single matrix-vector product over its scope. Entries expire after a TTL, the least recently used ones are evicted beyond `max_entries`, and entries touching a source are invalidated when the source is deleted or re-ingested. Changes made by other processes are caught on the first lookup after `check_interval` seconds: the entries of a source are invalidated when its row in the sources manifest differs from the one seen when the source was first cached.
+
+    Attributes:
+        threshold (float): The minimum cosine similarity between query embeddings for a hit.
+        max_entries (int): The maximum number of cached entries.
+        ttl (float): The lifetime of an entry in seconds (None disables expiry).
+        manifests: The sources manifest collection (`SOURCES_DB_NAME`) the cached sources are checked against (optional).
+        check_interval (float): The seconds between two checks of the cached sources against their manifests.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups not found in the cache.
+
+    Methods:
+        lookup(query_emb: List[float], source_ids: List[str], **params) -> dict | None:
+            Returns the most similar live entry above the threshold within the same scope, or None.
+
+        store(query_emb: List[float], source_ids: List[str], docs: List[Document] = None, answer: str = None, **params) -> dict:
+            Adds an entry holding the retrieved documents and, optionally, the generated answer.
+
+        on_source_change(source_id: str):
+            Drops the entries scoped to the source (or to all sources) and the entries whose documents come from it.
+
+        clear():
+            Empties the cache and resets its counters.
+    """
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL,
+                 manifests=None, check_interval=SEMANTIC_CACHE_CHECK_INTERVAL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.manifests = manifests
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # Entry id -> entry, least recently used first
+        self._created = OrderedDict()   # Entry id -> creation time, oldest first (ids grow with creation time)
+        self._scopes = {}               # Scope -> _Scope
+        self._by_source = {}            # Source id -> entry ids (None also holds the entries scoped to all sources)
+        self._next_id = 0
+        self._seen = {}                 # Source id -> its manifest row when first cached
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        add_source_listener(self)
+    # -------------------------------------------------- #
+
+    def __len__(self) -> int:
+        return len(self._entries)
+    # -------------------------------------------------- #
+
+    # -- Main Methods -- #
+    def lookup(self, query_emb: list[float], source_ids: list[str], **params) -> dict:
+        scope = self.scope(source_ids, params)
+        vector = self.normalize(query_emb)
+        # Seen before the search a miss leads to, so a change during it is caught by the next check
+        self.watch(scope[0])
+        self.check()
+        with self._lock:
+            self.expire()
+            rows = self._scopes.get(scope)
+            if not (rows):
+                self.misses += 1
+                return None
+
+            entry_id, similarity = rows.best(vector)
+            if (similarity < self.threshold):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]
+    # -------------------------------------------------- #
+
+    def store(self, query_emb: list[float], source_ids: list[str], docs: list[Document] = None, answer: str = None, **params) -> dict:
+        sources = set(source_ids or ())
+        sources.update(doc.metadata.get("source_id") for doc in (docs or ()))
+        sources.discard(None)
+        self.watch(sources)
+        entry = {
+            "vector": self.normalize(query_emb),
+            "scope": self.scope(source_ids, params),
+            "sources": sources,
+            "docs": list(docs) if (docs is not None) else None,
+            "answer": answer,
+            "created": time.monotonic(),
+        }
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._created[entry_id] = entry["created"]
+            self._scopes.setdefault(entry["scope"], _Scope(len(entry["vector"]))).add(entry_id, entry["vector"])
+            for source_id in self.keys(entry):
+                self._by_source.setdefault(source_id, set()).add(entry_id)
+            while (len(self._entries) > self.max_entries):
+                self.remove(next(iter(self._entries)))
+        return entry
+    # -------------------------------------------------- #
+
+    def on_source_change(self, source_id: str):
+        with self._lock:
+            stale = self._by_source.get(source_id, set()) | self._by_source.get(None, set())
+            for entry_id in stale:
+                self.remove(entry_id)
+            # Seen again when it is next cached
+            self._seen.pop(source_id, None)
+    # -------------------------------------------------- #
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._created.clear()
+            self._scopes.clear()
+            self._by_source.clear()
+            self._seen.clear()
+            self.hits = 0
+            self.misses = 0
+    # -------------------------------------------------- #
+
+    # -- Help Functions -- #
+    def watch(self, source_ids):
+        # Records the manifest rows of the sources not cached yet
+        if (self.manifests is None):
+            return
+        new = [source_id for source_id in source_ids if (source_id not in self._seen)]
+        if (new):
+            rows = self.manifest_rows(new)
+            with self._lock:
+                for source_id in new:
+                    self._seen.setdefault(source_id, rows.get(source_id))
+    # -------------------------------------------------- #
+
+    def check(self):
+        # Invalidates the sources whose manifest row changed since they were first cached
+        if (self.manifests is None) or (time.monotonic() - self._checked < self.check_interval):
+            return
+        # Marked as checked first, so concurrent lookups do not all query the manifests
+        self._checked = time.monotonic()
+        with self._lock:
+            for source_id in [source_id for source_id in self._seen if (source_id not in self._by_source)]:
+                del self._seen[source_id]
+            seen = dict(self._seen)
+        if not (seen):
+            return
+        rows = self.manifest_rows(list(seen))
+        for source_id, row in seen.items():
+            if (rows.get(source_id) != row):
+                self.on_source_change(source_id)
+    # -------------------------------------------------- #
+
+    def manifest_rows(self, source_ids: list[str]) -> dict:
+        rows = {}
+        for start in range(0, len(source_ids), FETCHING_LIMIT):
+            part = source_ids[start:start + FETCHING_LIMIT]
+            response = self.manifests.query.fetch_objects(filters=ids_filter(part), limit=len(part))
+            rows.update((obj.properties["source_id"], dict(obj.properties)) for obj in response.objects)
+        return rows
+    # -------------------------------------------------- #
+
+    def expire(self):
+        if (self.ttl is None):
+            return
+        # Only the oldest entries are looked at: they expire first
+        deadline = time.monotonic() - self.ttl
+        while (self._created) and (next(iter(self._created.values())) < deadline):
+            self.remove(next(iter(self._created)))
+    # -------------------------------------------------- #
+
+    def remove(self, entry_id: int):
+        # Drops an entry from every structure (the caller holds the lock)
+        entry = self._entries.pop(entry_id)
+        del self._created[entry_id]
+        rows = self._scopes[entry["scope"]]
+        rows.remove(entry_id)
+        if not (rows):
+            del self._scopes[entry["scope"]]
+        for source_id in self.keys(entry):
+            ids = self._by_source[source_id]
+            ids.discard(entry_id)
+            if not (ids):
+                del self._by_source[source_id]
+    # -------------------------------------------------- #
+
+    @staticmethod
+    def keys(entry: dict) -> set:
+        # The `_by_source` keys of an entry
+        return entry["sources"] if (entry["scope"][0]) else (entry["sources"] | {None})
+    # -------------------------------------------------- #
+
+    @staticmethod
+    def scope(source_ids: list[str], params: dict) -> tuple:
+        return (frozenset(source_ids or ()), tuple(sorted(params.items())))
+    # -------------------------------------------------- #
+
+    @staticmethod
+    def normalize(vector: list[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if (norm) else vector
+    # -------------------------------------------------- #
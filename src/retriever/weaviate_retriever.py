@@ -1,220 +1,586 @@
-from utils.config import *
-from utils.helpers import ids_filter, id_filter
-import numpy as np
-from collections import Counter
-from sentence_transformers import CrossEncoder
-from weaviate import WeaviateClient
-import weaviate.classes as wvc
-from weaviate.collections.classes.internal import Object
-
-from langchain_core.documents import Document
-from langchain_core.embeddings import Embeddings
-from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
-from langchain_community.vectorstores.utils import maximal_marginal_relevance
-# ================================================== #
-
-class Retriever(VectorStore):
-    """
-    Manages document retrieval from a Weaviate vector store.
-
-    The `Retriever` class is designed to find relevant documents from a Weaviate vector store based on a given query. It supports various search methods, including a hybrid similarity search, and includes functionality for re-ranking and data management.
-
-    Attributes:
-        client (WeaviateClient): The Weaviate client instance for interacting with the vector store.
-        embedder (Any): The embedding model used for generating query and document embeddings.
-        collection: The collection object retrieved from the Weaviate client.
-
-    Methods:
-        similarity_search(query: str, source_ids: List[str], auto_merge: bool = False, k: int = 16, top_k: int = 5, alpha: float = 0.5) -> List[Document]:
-            Executes a hybrid search combining both keyword and vector similarity. It returns a ranked list of relevant documents.
-
-        similarity_search_with_relevance_scores(query: str, source_ids: List[str], k: int = 5, alpha: float = 0.5) -> List[Tuple[Document, float]]:
-            Performs a similarity search and returns documents along with their relevance scores.
-
-        max_marginal_relevance_search(query: str, source_ids: List[str], k: int = 5, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Document]:
-            Performs a search to return a diverse set of documents by balancing relevance with novelty to the query.
-
-        rerank_docs(query: str, docs: List[Document], top_k: int) -> List[Document]:
-            Re-ranks a list of retrieved documents based on their relevance to the query using a cross-encoder model for improved accuracy.
-
-        as_retriever(**kwargs) -> VectorStoreRetriever:
-            Returns a retriever object for use with other LangChain components.
-            
-        delete(source_id: str):
-            Removes all documents associated with a specific source ID from the vector store.
-    """
-    def __init__(self, client: WeaviateClient, embedder: Embeddings) -> None:
-        self.client = client
-        self.embedder = embedder
-        self.collection = self.client.collections.get(DB_NAME)
-    # -------------------------------------------------- #
-  
-    # -- Main Methods -- #
-
-    # Response to documents
-    def objects_to_docs(self, objects: list[Object]) -> list[Document]:
-        docs = []
-        for obj in objects:
-            text = obj.properties["text"]
-            metadata = {"source_id": obj.properties["source_id"], "page_no": obj.properties["page_no"]}
-            docs.append(Document(page_content=text, metadata=metadata))
-        return docs
-    # -------------------------------------------------- #
-
-    def similarity_search(self, query: str, source_ids: list, auto_merge =False, k = 16, top_k = 5, alpha=0.5) -> list[Document]:
-        query_emb = self.embedder.embed_query(query)
-
-        objects = self.collection.query.hybrid(query=query, vector=query_emb,
-                                                filters=ids_filter(source_ids) if (source_ids) else None,
-                                                limit=k, alpha=alpha).objects
-        objects = sorted(objects, key=lambda obj: obj.properties["index"])
-        
-        if (auto_merge):
-            merged_objects = []
-            for source_id in source_ids:
-                merged_objects.extend(self.auto_merge(objects, source_id))
-            docs = merged_objects
-        
-        docs = self.objects_to_docs(objects)
-    
-        # Re-rank results
-        docs = self.rerank_docs(query, docs, top_k)
-        return docs
-    # -------------------------------------------------- #
-
-    def similarity_search_with_relevance_scores(self, query: str, source_ids: list, k=5, alpha=0.5) -> list[tuple[Document, float]]:
-        query_emb = self.embedder.embed_query(query)
-
-        objects = self.collection.query.hybrid(query=query, vector=query_emb,
-                                                filters=ids_filter(source_ids),
-                                                limit=k, alpha=alpha,
-                                                return_metadata=wvc.query.MetadataQuery(score=True)).objects
-        objects = sorted(objects, key=lambda obj: obj.properties["index"])
-
-        scores = [obj.metadata.score for obj in objects]
-        docs = self.objects_to_docs(objects)
-        docs = zip(docs, scores)
-
-        return list(docs)
-    # -------------------------------------------------- #
-
-    def max_marginal_relevance_search(self, query: str, source_ids: list, k=5, fetch_k=20, lambda_mult=0.5) -> list[tuple[Document, float]]:
-        query_emb = self.embedder.embed_query(query)
-
-        objects = self.collection.query.near_vector(near_vector=query_emb,
-                                                filters=ids_filter(source_ids),
-                                                limit=fetch_k,
-                                                return_metadata=wvc.query.MetadataQuery(distance=True),
-                                                include_vector= True).objects
-        objects = sorted(objects, key=lambda obj: obj.properties["index"])
-        
-        embeddings = [obj.vector["default"] for obj in objects]
-        mmr_selected = maximal_marginal_relevance(np.array(query_emb), embeddings, k=k, lambda_mult=lambda_mult)
-
-        objects = [objects[i] for i in mmr_selected]
-        docs = self.objects_to_docs(objects)
-
-        return docs
-    # -------------------------------------------------- #
-    
-    def delete(self, source_id: str):
-        self.collection.data.delete_many(where=id_filter(source_id))
-    # -------------------------------------------------- #
-    
-    # -- Advanced Methods -- #
-        
-    # Re-rank Results
-    def rerank_docs(self, query: str, docs: list[Document], top_k :int) -> list[Document]:
-        model = CrossEncoder(RERANKER_MODEL_NAME, trust_remote_code=True)
-
-        # Prepare the query-document pairs for the model
-        documents = [doc.page_content for doc in docs]
-        
-        # Rank docs against query
-        results = model.rank(query, documents, return_documents= False, top_k = top_k)
-        indices = [res['corpus_id'] for res in results]
-        docs = [docs[i] for i in indices]
-        return docs
-    # -------------------------------------------------- #
-
-    # Auto-Merge
-    def auto_merge(self, objects: list[Object], source_id: str) -> list[Object]:
-        source_id_filter = id_filter(source_id)
-
-        # Count retrieved level 1 & level 2 number
-        l1_count = Counter(obj.properties["l1"] for obj in objects)
-        l2_count = Counter(obj.properties["l2"] for obj in objects)
-
-        # Get level 0 & level 1 & level 2 chunks number to merge
-        l0_chunks_keys = [key for key, value in l1_count.items() if (value <= (L1 // 2))]
-        l1_chunks_keys = [key for key, value in l1_count.items() if (value >= (L1 // 2) + 1)]
-        l2_chunks_keys = [key for key, value in l2_count.items() if (value >= (L2 // 2) + 1)]
-
-        # Exclude l1 chunks from l2 merged chunks
-        l_ratio = L2 // L1 
-        l1_chunks_keys = [c for c in l1_chunks_keys if all(c not in range(p*l_ratio, (p+1)*l_ratio) for p in l2_chunks_keys)]
-
-        # Get level 0 chunks
-        l0_chunks = [obj for obj in objects if (obj.properties["l1"] in l0_chunks_keys)]
-
-        # Get level 1 chunks
-        if (l1_chunks_keys):
-            l1_filters = wvc.query.Filter.by_property("l1").contains_any(l1_chunks_keys) & source_id_filter
-            l1_chunks = self.collection.query.fetch_objects(filters=l1_filters, limit=FETCHING_LIMIT, sort=SORT).objects
-            l1_chunks = self.merge_chunks(l1_chunks, level="l1")
-        else:
-            l1_chunks = []
-
-        # Get level 2 chunks
-        if (l2_chunks_keys):
-            l2_filters = wvc.query.Filter.by_property("l2").contains_any(l2_chunks_keys) & source_id_filter
-            l2_chunks = self.collection.query.fetch_objects(filters=l2_filters, limit=FETCHING_LIMIT, sort=SORT).objects
-            l2_chunks = self.merge_chunks(l2_chunks, level="l2")
-        else:
-            l2_chunks = []
-
-        # Return all levels chunks
-        return l0_chunks + l1_chunks + l2_chunks
-    # -------------------------------------------------- #
-
-    # -- Auto-Merge [Help Functions] -- # 
-    def merge_chunks(self, objects: list[Object], level: str) -> list[Object]:
-        object_dict = {}
-        for obj in objects:
-            key = obj.properties[level]
-            if (key in object_dict):
-                object_dict[key]["text"] += (" " + obj.properties["text"])
-            else:
-                object_props = {
-                    "text": obj.properties["text"],
-                    "source_id": obj.properties["source_id"],
-                    "page_no": obj.properties["page_no"],
-                }
-                object_dict[key] = object_props
-        
-        # Convert object dictionary to weaviate object
-        chunks_objects = []
-        for obj_props in object_dict.values():
-            obj = Object(properties=obj_props, uuid=None, metadata=None, references=None, vector=None, collection=None)
-            chunks_objects.append(obj)
-        return chunks_objects
-    # -------------------------------------------------- #
-
-    # -- Retriever Methods -- #
-    def _get_retriever_tags(self) -> list[str]:
-        tags = [self.__class__.__name__]
-        if self.embeddings:
-            tags.append(self.embeddings.__class__.__name__)
-        return tags
-    # -------------------------------------------------- #
-
-    def as_retriever(self, **kwargs) -> VectorStoreRetriever:
-        tags = kwargs.pop("tags", None) or []
-        tags.extend(self._get_retriever_tags())
-        return VectorStoreRetriever(vectorstore=self, **kwargs, tags=tags)
-    # -------------------------------------------------- #
-    
-    # -- Abstract Methods -- #
-    def add_texts(self, texts, metadatas=None, **kwargs): return
-    def from_texts(cls, texts, embedding, metadatas=None, **kwargs): return
+from utils.config import *
+from utils.helpers import ids_filter, id_filter, source_uuid, merge_page_nos, notify_source_change, estimate_tokens, index_sort
+from utils.parent_index import ParentIndex, get_parent_index
+from utils.instrumentation import stage, text_bytes
+from retriever.reranker import Reranker, get_reranker
+from retriever.semantic_cache import SemanticCache
+from retriever.local_index import LocalIndex
+from retriever.mmr import maximal_marginal_relevance
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, defaultdict
+from weaviate import WeaviateClient, WeaviateAsyncClient
+import weaviate.classes as wvc
+from weaviate.collections.classes.internal import Object
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
+
+# Shared by the hybrid searches of multi-query retrievals (threads start on first use)
+SEARCH_POOL = ThreadPoolExecutor(max_workers=MULTI_QUERY_WORKERS, thread_name_prefix="multi-query")
+# ================================================== #
+
+class Retriever(VectorStore):
+    """
+    Manages document retrieval from a Weaviate vector store.
+
+    The `Retriever` class is designed to find relevant documents from a Weaviate vector store based on a given query. It supports various search methods, including a hybrid similarity search, and includes functionality for re-ranking and data management.
+
+    Attributes:
+        client (WeaviateClient): The Weaviate client instance for interacting with the vector store.
+        async_client (WeaviateAsyncClient): An optional connected async client used by the `a*` search methods. Without it they run the synchronous methods in a worker thread.
+        embedder (Any): The embedding model used for generating query and document embeddings.
+        reranker (Reranker): The cross-encoder re-ranking service. Defaults to the process-wide shared instance.
+        parent_index (ParentIndex): The local index of precomputed auto-merge parent chunks. Defaults to the process-wide shared instance.
+        merge_ratios (Tuple[float, float]): The share of a level 1 / level 2 group that must be retrieved for the group to be merged.
+        cache (SemanticCache): An optional semantic cache. When given, `similarity_search` reuses the documents retrieved for earlier, similar queries over the same sources.
+        local_index (LocalIndex): An optional in-process hybrid index. Hybrid searches over the sources it serves skip the database round trip.
+        collection: The collection object retrieved from the Weaviate client.
+        async_collection: The collection object retrieved from the async client (if given).
+
+    Methods:
+        similarity_search(query: str, source_ids: List[str], auto_merge: bool = False, k: int = 16, top_k: int = 5, alpha: float = 0.5) -> List[Document]:
+            Executes a hybrid search combining both keyword and vector similarity. It returns a ranked list of relevant documents.
+
+        asimilarity_search(...), asimilarity_search_with_relevance_scores(...), amulti_query_search(...), amax_marginal_relevance_search(...), amax_marginal_relevance_search_with_scores(...):
+            Asynchronous versions of the search methods, used by LangChain's `ainvoke` / `astream` chains.
+
+        similarity_search_with_relevance_scores(query: str, source_ids: List[str], k: int = 5, alpha: float = 0.5) -> List[Tuple[Document, float]]:
+            Performs a similarity search and returns documents along with their relevance scores.
+
+        max_marginal_relevance_search(query: str, source_ids: List[str], k: int = 5, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Document]:
+            Performs a search to return a diverse set of documents by balancing relevance with novelty to the query.
+
+        max_marginal_relevance_search_with_scores(query: str, source_ids: List[str], k: int = 5, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[Tuple[Document, float]]:
+            Same as `max_marginal_relevance_search`, returning each document with its cosine similarity to the query. The selection runs on the vectors returned by the candidate fetch.
+
+        cached_answer(query: str, source_ids: List[str], **inputs) -> str | None:
+            Returns the answer cached for a similar query over the same sources and prompt inputs, if any.
+
+        cache_answer(query: str, source_ids: List[str], answer: str, docs: List[Document] = None, **inputs):
+            Stores a generated answer in the semantic cache.
+
+        rerank_docs(query: str, docs: List[Document], top_k: int) -> List[Document]:
+            Re-ranks a list of retrieved documents based on their relevance to the query using the shared cross-encoder service for improved accuracy.
+
+        multi_query_search(queries: List[str], source_ids: List[str], auto_merge: bool = False, k: int = 16, top_k: int = 5, alpha: float = 0.5, token_budget: int = None) -> List[List[Document]]:
+            Retrieves context for several subtopics at once: all queries are embedded in one call and searched concurrently, candidates retrieved by several queries are de-duplicated by (source_id, index) and re-ranked in one batch. Each chunk is kept for the subtopic it scores highest on, and `token_budget` (if given) is split across the subtopics. Returns one list of documents per query.
+
+        auto_merge(objects: List[Object]) -> List[Object]:
+            Replaces retrieved chunks by their level 1 or level 2 parent chunks when more than `merge_ratios` of a parent's children were retrieved. Parents are resolved from the local parent index; sources it does not hold are fetched from the database in a single filtered query.
+
+        as_retriever(**kwargs) -> VectorStoreRetriever:
+            Returns a retriever object for use with other LangChain components.
+            
+        delete(source_id: str):
+            Removes all documents associated with a specific source ID from the vector store, along with its sources manifest entry, and invalidates cached results that depend on it.
+    """
+    def __init__(self, client: WeaviateClient, embedder: Embeddings, reranker: Reranker = None,
+                 async_client: WeaviateAsyncClient = None, parent_index: ParentIndex = None,
+                 merge_ratios=(L1_MERGE_RATIO, L2_MERGE_RATIO), cache: SemanticCache = None, local_index: LocalIndex = None) -> None:
+        self.client = client
+        self.async_client = async_client
+        self.embedder = embedder
+        self.reranker = reranker or get_reranker()
+        self.parent_index = parent_index or get_parent_index()
+        self.merge_ratios = merge_ratios
+        self.cache = cache
+        self.local_index = local_index
+        self.collection = self.client.collections.get(DB_NAME)
+        self.async_collection = self.async_client.collections.get(DB_NAME) if (self.async_client) else None
+    # -------------------------------------------------- #
+  
+    # -- Main Methods -- #
+
+    # Query embedding
+    def embed_query(self, query: str) -> list[float]:
+        with stage("retriever.embed_query", chars=len(query)):
+            return self.embedder.embed_query(query)
+    # -------------------------------------------------- #
+
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        # One encoder call for all queries when the embedder supports it
+        with stage("retriever.embed_query", queries=len(queries)):
+            if (hasattr(self.embedder, "embed_queries")):
+                return self.embedder.embed_queries(queries)
+            return [self.embedder.embed_query(query) for query in queries]
+    # -------------------------------------------------- #
+
+    # Hybrid Search
+    def hybrid_objects(self, query: str, query_emb: list[float], source_ids: list, k: int, alpha: float) -> list[Object]:
+        objects = self.local_objects(query, query_emb, source_ids, k, alpha)
+        if (objects is not None):
+            return objects
+
+        with stage("retriever.hybrid", k=k, alpha=alpha) as span:
+            objects = self.collection.query.hybrid(query=query, vector=query_emb,
+                                                    filters=ids_filter(source_ids) if (source_ids) else None,
+                                                    limit=k, alpha=alpha).objects
+            if (span): span.set(candidates=len(objects), bytes=text_bytes(objects))
+        return sorted(objects, key=lambda obj: obj.properties["index"])
+    # -------------------------------------------------- #
+
+    def local_objects(self, query: str, query_emb: list[float], source_ids: list, k: int, alpha: float) -> list[Object]:
+        # Hybrid search in the local index, None when it does not serve the sources
+        if (self.local_index is None) or not (self.local_index.serves(source_ids)):
+            return None
+        objects = self.local_index.search(query, query_emb, source_ids, k, alpha)
+        return sorted(objects, key=lambda obj: obj.properties["index"])
+    # -------------------------------------------------- #
+
+    # Response to documents
+    def objects_to_docs(self, objects: list[Object]) -> list[Document]:
+        docs = []
+        for obj in objects:
+            text = obj.properties["text"]
+            metadata = {"source_id": obj.properties["source_id"], "page_no": obj.properties["page_no"]}
+            docs.append(Document(page_content=text, metadata=metadata))
+        return docs
+    # -------------------------------------------------- #
+
+    def similarity_search(self, query: str, source_ids: list, auto_merge =False, k = 16, top_k = 5, alpha=0.5) -> list[Document]:
+        query_emb = self.embed_query(query)
+
+        # Reuse the results of a similar query
+        params = dict(auto_merge=auto_merge, k=k, top_k=top_k, alpha=alpha)
+        entry = self.cache_lookup(query_emb, source_ids, **params)
+        if (entry is not None):
+            return list(entry["docs"])
+
+        objects = self.hybrid_objects(query, query_emb, source_ids, k, alpha)
+        
+        if (auto_merge):
+            objects = self.auto_merge(objects)
+        
+        docs = self.objects_to_docs(objects)
+    
+        # Re-rank results
+        docs = self.rerank_docs(query, docs, top_k)
+
+        if (self.cache is not None):
+            self.cache.store(query_emb, source_ids, docs, **params)
+        return docs
+    # -------------------------------------------------- #
+
+    def similarity_search_with_relevance_scores(self, query: str, source_ids: list, k=5, alpha=0.5) -> list[tuple[Document, float]]:
+        query_emb = self.embed_query(query)
+
+        objects = self.local_objects(query, query_emb, source_ids, k, alpha)
+        if (objects is None):
+            with stage("retriever.hybrid", k=k, alpha=alpha) as span:
+                objects = self.collection.query.hybrid(query=query, vector=query_emb,
+                                                        filters=ids_filter(source_ids),
+                                                        limit=k, alpha=alpha,
+                                                        return_metadata=wvc.query.MetadataQuery(score=True)).objects
+                if (span): span.set(candidates=len(objects), bytes=text_bytes(objects))
+            objects = sorted(objects, key=lambda obj: obj.properties["index"])
+
+        scores = [obj.metadata.score for obj in objects]
+        docs = self.objects_to_docs(objects)
+        docs = zip(docs, scores)
+
+        return list(docs)
+    # -------------------------------------------------- #
+
+    def max_marginal_relevance_search(self, query: str, source_ids: list, k=5, fetch_k=20, lambda_mult=0.5) -> list[Document]:
+        docs = self.max_marginal_relevance_search_with_scores(query, source_ids, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+        return [doc for doc, _ in docs]
+    # -------------------------------------------------- #
+
+    def max_marginal_relevance_search_with_scores(self, query: str, source_ids: list, k=5, fetch_k=20, lambda_mult=0.5) -> list[tuple[Document, float]]:
+        query_emb = self.embed_query(query)
+
+        with stage("retriever.near_vector", k=fetch_k) as span:
+            objects = self.collection.query.near_vector(near_vector=query_emb,
+                                                    filters=ids_filter(source_ids),
+                                                    limit=fetch_k,
+                                                    return_metadata=wvc.query.MetadataQuery(distance=True),
+                                                    include_vector= True).objects
+            if (span): span.set(candidates=len(objects), bytes=text_bytes(objects))
+        objects = sorted(objects, key=lambda obj: obj.properties["index"])
+
+        return self.mmr_select(query_emb, objects, k, lambda_mult)
+    # -------------------------------------------------- #
+    
+    def delete(self, source_id: str):
+        self.collection.data.delete_many(where=id_filter(source_id))
+        self.client.collections.get(SOURCES_DB_NAME).data.delete_by_id(source_uuid(source_id))
+        self.parent_index.delete(source_id)
+        notify_source_change(source_id)
+    # -------------------------------------------------- #
+    
+    # -- Advanced Methods -- #
+
+    # MMR Selection
+    def mmr_select(self, query_emb: list[float], objects: list[Object], k: int, lambda_mult: float) -> list[tuple[Document, float]]:
+        if not (objects):
+            return []
+        with stage("retriever.mmr", candidates=len(objects), k=k):
+            embeddings = np.array([obj.vector["default"] for obj in objects], dtype=np.float32)
+            selected, scores = maximal_marginal_relevance(query_emb, embeddings, k=k, lambda_mult=lambda_mult)
+
+        docs = self.objects_to_docs([objects[i] for i in selected])
+        return list(zip(docs, scores.tolist()))
+    # -------------------------------------------------- #
+
+    # Semantic Cache
+    def cache_lookup(self, query_emb: list[float], source_ids: list, **params) -> dict:
+        if (self.cache is None):
+            return None
+        with stage("retriever.cache_lookup") as span:
+            entry = self.cache.lookup(query_emb, source_ids, **params)
+            if (span): span.set(hit=entry is not None)
+        return entry
+    # -------------------------------------------------- #
+
+    def cached_answer(self, query: str, source_ids: list, **inputs) -> str:
+        if (self.cache is None):
+            return None
+        entry = self.cache_lookup(self.embed_query(query), source_ids, kind="answer", **inputs)
+        return entry["answer"] if (entry is not None) else None
+    # -------------------------------------------------- #
+
+    def cache_answer(self, query: str, source_ids: list, answer: str, docs: list[Document] = None, **inputs):
+        if (self.cache is not None):
+            self.cache.store(self.embed_query(query), source_ids, docs, answer=answer, kind="answer", **inputs)
+    # -------------------------------------------------- #
+        
+    # Re-rank Results
+    def rerank_docs(self, query: str, docs: list[Document], top_k :int) -> list[Document]:
+        # Prepare the query-document pairs for the model
+        documents = [doc.page_content for doc in docs]
+        
+        # Rank docs against query (batched with concurrent requests)
+        with stage("retriever.rerank", candidates=len(documents), top_k=top_k):
+            results = self.reranker.rank(query, documents, top_k=top_k)
+        indices = [res['corpus_id'] for res in results]
+        docs = [docs[i] for i in indices]
+        return docs
+    # -------------------------------------------------- #
+
+    # Multi-Query Search
+    def multi_query_search(self, queries: list[str], source_ids: list, auto_merge=False, k=16, top_k=5, alpha=0.5, token_budget: int = None) -> list[list[Document]]:
+        if not (queries):
+            return []
+
+        query_embs = self.embed_queries(queries)
+        results = list(SEARCH_POOL.map(lambda query, query_emb: self.hybrid_objects(query, query_emb, source_ids, k, alpha), queries, query_embs))
+        if (auto_merge):
+            results = [self.auto_merge(objects) for objects in results]
+
+        docs, hits = self.dedupe_candidates(results)
+        with stage("retriever.rerank", candidates=len(docs), pairs=len(hits), top_k=top_k):
+            scores = self.reranker.score([(queries[q], docs[d].page_content) for q, d in hits])
+        return self.assign_subtopics(len(queries), docs, hits, scores, top_k, token_budget)
+    # -------------------------------------------------- #
+
+    def dedupe_candidates(self, results: list[list[Object]]) -> tuple[list[Document], list[tuple[int, int]]]:
+        # Unique chunks (by source and index, merged parents by text) and the (query, chunk) pairs that retrieved them
+        docs, positions, hits = [], {}, {}
+        for q, objects in enumerate(results):
+            for obj in objects:
+                key = (obj.properties["source_id"], obj.properties.get("index", obj.properties["text"]))
+                if (key not in positions):
+                    positions[key] = len(docs)
+                    docs.extend(self.objects_to_docs([obj]))
+                hits[(q, positions[key])] = None
+        return docs, list(hits)
+    # -------------------------------------------------- #
+
+    def assign_subtopics(self, n_queries: int, docs: list[Document], hits: list[tuple[int, int]], scores: list[float],
+                         top_k: int, token_budget: int = None) -> list[list[Document]]:
+        # Each chunk goes to the subtopic that scores it highest, so it reaches the prompt once
+        best = {}
+        for (q, d), score in zip(hits, scores):
+            if (d not in best) or (score > best[d][1]):
+                best[d] = (q, score)
+
+        ranked = [[] for _ in range(n_queries)]
+        for d, (q, score) in best.items():
+            ranked[q].append((score, d))
+        ranked = [sorted(candidates, key=lambda item: item[0], reverse=True)[:top_k] for candidates in ranked]
+
+        if (token_budget):
+            ranked = self.split_budget(ranked, docs, token_budget)
+        return [[docs[d] for _, d in candidates] for candidates in ranked]
+    # -------------------------------------------------- #
+
+    @staticmethod
+    def split_budget(ranked: list[list[tuple[float, int]]], docs: list[Document], token_budget: int) -> list[list[tuple[float, int]]]:
+        # Equal share per subtopic first, then the unused tokens go to the best remaining chunks of any subtopic
+        share = token_budget // max(len(ranked), 1)
+        kept, rest, used = [], [], 0
+        for q, candidates in enumerate(ranked):
+            spent, keep = 0, []
+            for score, d in candidates:
+                cost = estimate_tokens(docs[d].page_content)
+                if (spent + cost <= share):
+                    keep.append((score, d))
+                    spent += cost
+                else:
+                    rest.append((score, d, q, cost))
+            kept.append(keep)
+            used += spent
+
+        for score, d, q, cost in sorted(rest, key=lambda item: item[0], reverse=True):
+            if (used + cost <= token_budget):
+                kept[q].append((score, d))
+                used += cost
+        return [sorted(keep, key=lambda item: item[0], reverse=True) for keep in kept]
+    # -------------------------------------------------- #
+
+    # Auto-Merge
+    def auto_merge(self, objects: list[Object]) -> list[Object]:
+        l0_chunks, plan = self.merge_plan(objects)
+        if not (plan):
+            return l0_chunks
+
+        with stage("retriever.auto_merge", candidates=len(objects)) as span:
+            # Get level 1 & level 2 chunks from the parent index
+            parents, plan = self.parent_index.resolve(plan)
+            merged_chunks = self.props_to_objects(parents)
+
+            # Get the rest of the sources in one query
+            merge_objects = []
+            if (plan):
+                merge_objects = self.collection.query.fetch_objects(filters=self.merge_filter(plan), limit=self.merge_limit(plan), sort=index_sort()).objects
+                merged_chunks.extend(self.merge_fetched(merge_objects, plan))
+            if (span): span.set(local_parents=len(parents), fetched=len(merge_objects), bytes=text_bytes(merge_objects))
+
+        # Return all levels chunks
+        return l0_chunks + merged_chunks
+    # -------------------------------------------------- #
+
+    # -- Auto-Merge [Help Functions] -- # 
+    def merge_plan(self, objects: list[Object]) -> tuple[list[Object], dict]:
+        objects_by_source = defaultdict(list)
+        for obj in objects:
+            objects_by_source[obj.properties["source_id"]].append(obj)
+
+        l0_chunks, plan = [], {}
+        for source_id, source_objects in objects_by_source.items():
+            # Count retrieved level 1 & level 2 number
+            l1_count = Counter(obj.properties["l1"] for obj in source_objects)
+            l2_count = Counter(obj.properties["l2"] for obj in source_objects)
+
+            # Get level 1 & level 2 chunks number to merge
+            l1_ratio, l2_ratio = self.merge_ratios
+            l1_chunks_keys = [key for key, value in l1_count.items() if (value > L1 * l1_ratio)]
+            l2_chunks_keys = [key for key, value in l2_count.items() if (value > L2 * l2_ratio)]
+
+            # Exclude l1 chunks from l2 merged chunks
+            l_ratio = L2 // L1 
+            l1_chunks_keys = [c for c in l1_chunks_keys if all(c not in range(p*l_ratio, (p+1)*l_ratio) for p in l2_chunks_keys)]
+
+            # Keep level 0 chunks that are not part of a merged chunk
+            l0_chunks.extend(obj for obj in source_objects
+                             if (obj.properties["l1"] not in l1_chunks_keys) and (obj.properties["l2"] not in l2_chunks_keys))
+            if (l1_chunks_keys) or (l2_chunks_keys):
+                plan[source_id] = (l1_chunks_keys, l2_chunks_keys)
+
+        return l0_chunks, plan
+    # -------------------------------------------------- #
+
+    def merge_filter(self, plan: dict):
+        source_filters = []
+        for source_id, (l1_chunks_keys, l2_chunks_keys) in plan.items():
+            level_filters = []
+            if (l1_chunks_keys):
+                level_filters.append(wvc.query.Filter.by_property("l1").contains_any(l1_chunks_keys))
+            if (l2_chunks_keys):
+                level_filters.append(wvc.query.Filter.by_property("l2").contains_any(l2_chunks_keys))
+            source_filters.append(id_filter(source_id) & wvc.query.Filter.any_of(level_filters))
+        return wvc.query.Filter.any_of(source_filters)
+    # -------------------------------------------------- #
+
+    def merge_limit(self, plan: dict) -> int:
+        return sum(len(l1_keys) * L1 + len(l2_keys) * L2 for l1_keys, l2_keys in plan.values())
+    # -------------------------------------------------- #
+
+    def merge_fetched(self, objects: list[Object], plan: dict) -> list[Object]:
+        l1_chunks, l2_chunks = [], []
+        for obj in objects:
+            l1_chunks_keys, l2_chunks_keys = plan[obj.properties["source_id"]]
+            if (obj.properties["l2"] in l2_chunks_keys):
+                l2_chunks.append(obj)
+            elif (obj.properties["l1"] in l1_chunks_keys):
+                l1_chunks.append(obj)
+        return self.merge_chunks(l1_chunks, level="l1") + self.merge_chunks(l2_chunks, level="l2")
+    # -------------------------------------------------- #
+
+    def merge_chunks(self, objects: list[Object], level: str) -> list[Object]:
+        groups = {}
+        for obj in objects:
+            key = (obj.properties["source_id"], obj.properties[level])
+            groups.setdefault(key, []).append(obj.properties)
+
+        merged_props = []
+        for (source_id, _), group in groups.items():
+            merged_props.append({
+                "text": " ".join(props["text"] for props in group),
+                "source_id": source_id,
+                "page_no": merge_page_nos([props["page_no"] for props in group]),
+            })
+        return self.props_to_objects(merged_props)
+    # -------------------------------------------------- #
+
+    def props_to_objects(self, props_list: list[dict]) -> list[Object]:
+        # Convert merged properties to weaviate objects
+        return [Object(properties=props, uuid=None, metadata=None, references=None, vector=None, collection=None)
+                for props in props_list]
+    # -------------------------------------------------- #
+
+    # -- Async Methods -- #
+    async def asimilarity_search(self, query: str, source_ids: list, auto_merge =False, k = 16, top_k = 5, alpha=0.5) -> list[Document]:
+        if (self.async_collection is None):
+            return await asyncio.to_thread(self.similarity_search, query, source_ids, auto_merge=auto_merge, k=k, top_k=top_k, alpha=alpha)
+
+        query_emb = await asyncio.to_thread(self.embed_query, query)
+
+        params = dict(auto_merge=auto_merge, k=k, top_k=top_k, alpha=alpha)
+        entry = self.cache_lookup(query_emb, source_ids, **params)
+        if (entry is not None):
+            return list(entry["docs"])
+
+        objects = await self.ahybrid_objects(query, query_emb, source_ids, k, alpha)
+
+        if (auto_merge):
+            objects = await self.aauto_merge(objects)
+
+        docs = self.objects_to_docs(objects)
+
+        # Re-rank results
+        docs = await self.arerank_docs(query, docs, top_k)
+
+        if (self.cache is not None):
+            self.cache.store(query_emb, source_ids, docs, **params)
+        return docs
+    # -------------------------------------------------- #
+
+    async def ahybrid_objects(self, query: str, query_emb: list[float], source_ids: list, k: int, alpha: float) -> list[Object]:
+        objects = await self.alocal_objects(query, query_emb, source_ids, k, alpha)
+        if (objects is not None):
+            return objects
+
+        with stage("retriever.hybrid", k=k, alpha=alpha) as span:
+            response = await self.async_collection.query.hybrid(query=query, vector=query_emb,
+                                                                filters=ids_filter(source_ids) if (source_ids) else None,
+                                                                limit=k, alpha=alpha)
+            if (span): span.set(candidates=len(response.objects), bytes=text_bytes(response.objects))
+        return sorted(response.objects, key=lambda obj: obj.properties["index"])
+    # -------------------------------------------------- #
+
+    async def alocal_objects(self, query: str, query_emb: list[float], source_ids: list, k: int, alpha: float) -> list[Object]:
+        # Searches of loaded sources run inline, loading a source blocks on the database so it runs in a thread
+        if (self.local_index is None) or not (self.local_index.serves(source_ids)):
+            return None
+        if (self.local_index.is_loaded(source_ids)):
+            return self.local_objects(query, query_emb, source_ids, k, alpha)
+        return await asyncio.to_thread(self.local_objects, query, query_emb, source_ids, k, alpha)
+    # -------------------------------------------------- #
+
+    async def amulti_query_search(self, queries: list[str], source_ids: list, auto_merge=False, k=16, top_k=5, alpha=0.5, token_budget: int = None) -> list[list[Document]]:
+        if (self.async_collection is None):
+            return await asyncio.to_thread(self.multi_query_search, queries, source_ids, auto_merge=auto_merge, k=k, top_k=top_k, alpha=alpha, token_budget=token_budget)
+        if not (queries):
+            return []
+
+        query_embs = await asyncio.to_thread(self.embed_queries, queries)
+        results = await asyncio.gather(*[self.ahybrid_objects(query, query_emb, source_ids, k, alpha) for query, query_emb in zip(queries, query_embs)])
+        if (auto_merge):
+            results = await asyncio.gather(*[self.aauto_merge(objects) for objects in results])
+
+        docs, hits = self.dedupe_candidates(results)
+        with stage("retriever.rerank", candidates=len(docs), pairs=len(hits), top_k=top_k):
+            scores = await asyncio.wrap_future(self.reranker.submit([(queries[q], docs[d].page_content) for q, d in hits]))
+        return self.assign_subtopics(len(queries), docs, hits, scores, top_k, token_budget)
+    # -------------------------------------------------- #
+
+    async def asimilarity_search_with_relevance_scores(self, query: str, source_ids: list, k=5, alpha=0.5) -> list[tuple[Document, float]]:
+        if (self.async_collection is None):
+            return await asyncio.to_thread(self.similarity_search_with_relevance_scores, query, source_ids, k=k, alpha=alpha)
+
+        query_emb = await asyncio.to_thread(self.embed_query, query)
+
+        objects = await self.alocal_objects(query, query_emb, source_ids, k, alpha)
+        if (objects is None):
+            with stage("retriever.hybrid", k=k, alpha=alpha) as span:
+                response = await self.async_collection.query.hybrid(query=query, vector=query_emb,
+                                                                    filters=ids_filter(source_ids),
+                                                                    limit=k, alpha=alpha,
+                                                                    return_metadata=wvc.query.MetadataQuery(score=True))
+                if (span): span.set(candidates=len(response.objects), bytes=text_bytes(response.objects))
+            objects = sorted(response.objects, key=lambda obj: obj.properties["index"])
+
+        scores = [obj.metadata.score for obj in objects]
+        docs = self.objects_to_docs(objects)
+        return list(zip(docs, scores))
+    # -------------------------------------------------- #
+
+    async def amax_marginal_relevance_search(self, query: str, source_ids: list, k=5, fetch_k=20, lambda_mult=0.5) -> list[Document]:
+        docs = await self.amax_marginal_relevance_search_with_scores(query, source_ids, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+        return [doc for doc, _ in docs]
+    # -------------------------------------------------- #
+
+    async def amax_marginal_relevance_search_with_scores(self, query: str, source_ids: list, k=5, fetch_k=20, lambda_mult=0.5) -> list[tuple[Document, float]]:
+        if (self.async_collection is None):
+            return await asyncio.to_thread(self.max_marginal_relevance_search_with_scores, query, source_ids, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+
+        query_emb = await asyncio.to_thread(self.embed_query, query)
+
+        with stage("retriever.near_vector", k=fetch_k) as span:
+            response = await self.async_collection.query.near_vector(near_vector=query_emb,
+                                                                     filters=ids_filter(source_ids),
+                                                                     limit=fetch_k,
+                                                                     return_metadata=wvc.query.MetadataQuery(distance=True),
+                                                                     include_vector= True)
+            if (span): span.set(candidates=len(response.objects), bytes=text_bytes(response.objects))
+        objects = sorted(response.objects, key=lambda obj: obj.properties["index"])
+
+        return self.mmr_select(query_emb, objects, k, lambda_mult)
+    # -------------------------------------------------- #
+
+    async def arerank_docs(self, query: str, docs: list[Document], top_k :int) -> list[Document]:
+        documents = [doc.page_content for doc in docs]
+        with stage("retriever.rerank", candidates=len(documents), top_k=top_k):
+            results = await self.reranker.arank(query, documents, top_k=top_k)
+        return [docs[res['corpus_id']] for res in results]
+    # -------------------------------------------------- #
+
+    async def aauto_merge(self, objects: list[Object]) -> list[Object]:
+        l0_chunks, plan = self.merge_plan(objects)
+        if not (plan):
+            return l0_chunks
+
+        with stage("retriever.auto_merge", candidates=len(objects)) as span:
+            parents, plan = self.parent_index.resolve(plan)
+            merged_chunks = self.props_to_objects(parents)
+            merge_objects = []
+            if (plan):
+                response = await self.async_collection.query.fetch_objects(filters=self.merge_filter(plan), limit=self.merge_limit(plan), sort=index_sort())
+                merge_objects = response.objects
+                merged_chunks.extend(self.merge_fetched(merge_objects, plan))
+            if (span): span.set(local_parents=len(parents), fetched=len(merge_objects), bytes=text_bytes(merge_objects))
+        return l0_chunks + merged_chunks
+    # -------------------------------------------------- #
+
+    # -- Retriever Methods -- #
+    def _get_retriever_tags(self) -> list[str]:
+        tags = [self.__class__.__name__]
+        if self.embeddings:
+            tags.append(self.embeddings.__class__.__name__)
+        return tags
+    # -------------------------------------------------- #
+
+    def as_retriever(self, **kwargs) -> VectorStoreRetriever:
+        tags = kwargs.pop("tags", None) or []
+        tags.extend(self._get_retriever_tags())
+        return VectorStoreRetriever(vectorstore=self, **kwargs, tags=tags)
+    # -------------------------------------------------- #
+    
+    # -- Abstract Methods -- #
+    def add_texts(self, texts, metadatas=None, **kwargs): return
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs): return
     # -------------------------------------------------- #
\ No newline at end of file
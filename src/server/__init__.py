@@ -0,0 +1 @@
+__all__ = ['prompts', 'limits', 'app']
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""
+Retrieval and lesson generation service.
+
+One process holds a pooled Weaviate client (sync and async), a warm embedding model, the shared cross-encoder re-ranker and a semantic cache, and serves them to all learners. Each stage (retrieval, generation) has its own concurrency limit and bounded queue: requests beyond the queue get 429 and requests that wait too long get 503.
+
+Usage (from `src/`, a single worker so the models are loaded once):
+    uvicorn server.app:app --host 0.0.0.0 --port 8000
+    python -m server.app
+"""
+# Utils
+from utils.config import *
+from utils.db_config import DB
+from utils.instrumentation import instrumentation, PrometheusSink
+from preprocessing.embedding import Embedding
+from retriever.semantic_cache import SemanticCache
+from retriever.local_index import LocalIndex
+from retriever.weaviate_retriever import Retriever
+from server.limits import StageLimiter
+from server.prompts import DOCUMENT_PROMPT, LESSON_PROMPT, HYDE_PROMPT_TEMPLATE
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from langchain_core.documents import Document
+from langchain_core.prompts.base import format_document
+from langchain_google_genai import GoogleGenerativeAI
+# ================================================== #
+
+# -- Requests -- #
+class RetrieveRequest(BaseModel):
+    query: str = Field(min_length=1)
+    source_ids: list[str] | None = None
+    auto_merge: bool = False
+    k: int = Field(30, ge=1, le=200)
+    top_k: int = Field(15, ge=1, le=100)
+    alpha: float = Field(0.25, ge=0, le=1)
+
+class LessonRequest(RetrieveRequest):
+    domain: str = "cybersecurity"
+    hyde: bool = False      # Search with a hypothetical answer written by `HYDE_MODEL_NAME` instead of the raw query
+    subtopics: list[str] | None = Field(None, max_length=16)   # Retrieve context per subtopic in one batch instead of for the query
+    token_budget: int = Field(CONTEXT_TOKEN_BUDGET, ge=256)     # Context tokens split across the subtopics
+# -------------------------------------------------- #
+
+# -- Shared Services -- #
+class Services:
+    """
+    The long-lived clients, models and stage limiters shared by all requests.
+
+    Attributes:
+        client (WeaviateClient): The pooled sync client.
+        async_client (WeaviateAsyncClient): The pooled async client used by the retrieval endpoints.
+        embedder (Embedding): The warm embedding model.
+        retriever (Retriever): The retriever over both clients, with the shared re-ranker, the semantic cache and the local index.
+        local_index (LocalIndex): The in-process index of the hot sources, `LOCAL_INDEX_SOURCES` (if `SERVER_LOCAL_INDEX` is set).
+        lesson_chain: The lesson prompt piped into the LLM.
+        hyde_chain: The HyDE prompt piped into the faster LLM.
+        retrieval (StageLimiter): The limiter of embedding, search and re-ranking.
+        generation (StageLimiter): The limiter of LLM calls.
+        metrics (PrometheusSink): The per-stage timings exposed on `/metrics`.
+    """
+    def __init__(self, client, async_client, embedder: Embedding):
+        self.client = client
+        self.async_client = async_client
+        self.embedder = embedder
+        self.local_index = LocalIndex(client.collections.get(DB_NAME), client.collections.get(SOURCES_DB_NAME)) if (SERVER_LOCAL_INDEX) else None
+        self.retriever = Retriever(client, embedder, async_client=async_client,
+                                   cache=SemanticCache(manifests=client.collections.get(SOURCES_DB_NAME)) if (SERVER_SEMANTIC_CACHE) else None,
+                                   local_index=self.local_index)
+
+        self.lesson_chain = LESSON_PROMPT | GoogleGenerativeAI(model=LLM_MODEL_NAME, google_api_key=GOOGLE_API_KEY, temperature=0)
+        self.hyde_chain = HYDE_PROMPT_TEMPLATE | GoogleGenerativeAI(model=HYDE_MODEL_NAME, google_api_key=GOOGLE_API_KEY, temperature=0)
+
+        self.retrieval = StageLimiter("retrieval", SERVER_RETRIEVAL_CONCURRENCY)
+        self.generation = StageLimiter("generation", SERVER_GENERATION_CONCURRENCY)
+        self.metrics = instrumentation.add_sink(PrometheusSink())
+
+    def warm_up(self):
+        # Load the models and run one forward pass each before the first request
+        self.embedder.embed_query("warm up")
+        self.retriever.reranker.score([("warm up", "warm up")])
+        if (self.local_index is not None) and (LOCAL_INDEX_SOURCES):
+            self.local_index.prefetch(LOCAL_INDEX_SOURCES).result()
+
+    async def close(self):
+        instrumentation.remove_sink(self.metrics)
+        if (self.local_index is not None):
+            self.local_index.close()
+        await self.async_client.close()
+        self.client.close()
+# -------------------------------------------------- #
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = DB()
+    client = db.connect()
+    async_client = await db.connect_async()
+    services = Services(client, async_client, Embedding())
+    await asyncio.to_thread(services.warm_up)
+
+    app.state.services = services
+    try:
+        yield
+    finally:
+        await services.close()
+
+app = FastAPI(title="Edu-RAG", lifespan=lifespan)
+# -------------------------------------------------- #
+
+# -- Helpers -- #
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def doc_to_dict(doc: Document) -> dict:
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+async def retrieve(services: Services, body: RetrieveRequest, query: str = None) -> list[Document]:
+    async with services.retrieval.slot():
+        if (getattr(body, "subtopics", None)):
+            subtopic_docs = await services.retriever.amulti_query_search(body.subtopics, body.source_ids, auto_merge=body.auto_merge,
+                                                                         k=body.k, top_k=body.top_k, alpha=body.alpha,
+                                                                         token_budget=body.token_budget)
+            return [doc for docs in subtopic_docs for doc in docs]
+        return await services.retriever.asimilarity_search(query or body.query, body.source_ids, auto_merge=body.auto_merge,
+                                                           k=body.k, top_k=body.top_k, alpha=body.alpha)
+# -------------------------------------------------- #
+
+# -- Endpoints -- #
+@app.get("/health")
+async def health(request: Request) -> dict:
+    services = request.app.state.services
+    stats = {"status": "ok", "stages": {limiter.name: limiter.stats() for limiter in (services.retrieval, services.generation)}}
+    if (services.local_index is not None):
+        stats["local_index"] = services.local_index.stats()
+    return stats
+
+@app.get("/metrics")
+async def metrics(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(request.app.state.services.metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/retrieve")
+async def retrieve_documents(body: RetrieveRequest, request: Request) -> dict:
+    docs = await retrieve(request.app.state.services, body)
+    return {"documents": [doc_to_dict(doc) for doc in docs]}
+
+@app.post("/lesson")
+async def lesson(body: LessonRequest, request: Request) -> StreamingResponse:
+    services = request.app.state.services
+    inputs = body.model_dump(exclude={"query", "source_ids"})
+    inputs["subtopics"] = tuple(body.subtopics or ())
+
+    # Served from the semantic cache without taking a generation slot
+    answer = await asyncio.to_thread(services.retriever.cached_answer, body.query, body.source_ids, **inputs)
+    if (answer is not None):
+        events = iter([sse("token", {"text": answer}), sse("done", {"cached": True})])
+        return StreamingResponse(events, media_type="text/event-stream")
+
+    query = body.query
+    if (body.hyde) and not (body.subtopics):
+        async with services.generation.slot():
+            query = await services.hyde_chain.ainvoke({"query": body.query, "domain": body.domain})
+    docs = await retrieve(services, body, query)
+
+    # The slot is held until the stream ends (or the client disconnects)
+    permit = await services.generation.acquire()
+    return StreamingResponse(stream_lesson(services, body, inputs, docs, permit), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(permit.release))
+
+async def stream_lesson(services: Services, body: LessonRequest, inputs: dict, docs: list[Document], permit):
+    try:
+        yield sse("context", [doc.metadata for doc in docs])
+
+        context = DOCUMENT_SEPERATOR.join(format_document(doc, DOCUMENT_PROMPT) for doc in docs)
+        answer = []
+        async for chunk in services.lesson_chain.astream({"input": body.query, "domain": body.domain, "context": context}):
+            answer.append(chunk)
+            yield sse("token", {"text": chunk})
+
+        await asyncio.to_thread(services.retriever.cache_answer, body.query, body.source_ids, "".join(answer), docs, **inputs)
+        yield sse("done", {"cached": False})
+    except Exception as e:
+        yield sse("error", {"detail": str(e)})
+    finally:
+        permit.release()
+# -------------------------------------------------- #
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
@@ -0,0 +1,92 @@
+# Utils
+from utils.config import *
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+# ================================================== #
+
+class Permit:
+    """
+    A held slot of a `StageLimiter`. Releasing it more than once has no effect, so a streaming response can release it both when the stream ends and in its background task.
+    """
+    __slots__ = ("limiter", "released")
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.released = False
+
+    def release(self):
+        if not (self.released):
+            self.released = True
+            self.limiter._release()
+# -------------------------------------------------- #
+
+class StageLimiter:
+    """
+    Concurrency limit with a bounded wait queue for one stage of the service (retrieval, generation).
+
+    Requests beyond `concurrency` wait for a free slot. Once `max_waiting` requests are already waiting the stage answers 429, and a request that waits longer than `timeout` seconds gets 503, so overload is pushed back to clients instead of piling up in memory.
+
+    Attributes:
+        name (str): The stage name, used in error messages and stats.
+        concurrency (int): The maximum number of requests running the stage at once.
+        max_waiting (int): The maximum number of requests waiting for a slot.
+        timeout (float): The maximum time a request waits for a slot, in seconds.
+
+    Methods:
+        acquire() -> Permit:
+            Waits for a slot and returns its permit, or raises `HTTPException` (429 / 503).
+
+        slot():
+            Async context manager holding a slot for the duration of the block.
+
+        stats() -> dict:
+            Returns the active, waiting and rejected request counts.
+    """
+    def __init__(self, name: str, concurrency: int, max_waiting=SERVER_MAX_WAITING, timeout=SERVER_QUEUE_TIMEOUT):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+    # -------------------------------------------------- #
+
+    async def acquire(self) -> Permit:
+        if (self._semaphore.locked()) and (self.waiting >= self.max_waiting):
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail=f"Too many queued {self.name} requests",
+                                headers={"Retry-After": "1"})
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail=f"Timed out waiting for a {self.name} slot",
+                                headers={"Retry-After": str(max(1, int(self.timeout)))})
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        return Permit(self)
+
+    def _release(self):
+        self.active -= 1
+        self._semaphore.release()
+    # -------------------------------------------------- #
+
+    @asynccontextmanager
+    async def slot(self):
+        permit = await self.acquire()
+        try:
+            yield permit
+        finally:
+            permit.release()
+    # -------------------------------------------------- #
+
+    def stats(self) -> dict:
+        return {"concurrency": self.concurrency, "active": self.active, "waiting": self.waiting, "rejected": self.rejected}
+# -------------------------------------------------- #
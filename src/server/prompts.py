@@ -0,0 +1,34 @@
+# Prompts
+from langchain_core.prompts import PromptTemplate
+# ================================================== #
+
+BASE_PROMPT ="""You are an expert {domain} instructor. 
+Your task is to write a detailed, 800-word lesson on the topic of ```{input}``` for a {domain} trainee. 
+Use the following source materials to ensure accuracy and factual correctness:
+
+```{context}```
+
+Your lesson must be structured with the following sections: an introduction that defines the core concepts, 
+a detailed explanation of the key technical principles, a "real-world application" section, and a summary. 
+Maintain a professional and technical tone throughout. At the end of the lesson, include a "References" section. 
+For each piece of information, cite the source using a numerical reference corresponding to the snippet it cites. 
+
+The references should be in the following format:
+[1] Source Title - Page Number 
+[2] Source Title - Page Number, etc.
+
+Ensure that the lesson is comprehensive and covers all aspects of the topic.
+Do not include information not found in the source material.
+Cite only the sources provided in the context."""
+
+HYDE_PROMPT = """You are an expert {domain} instructor. 
+Please write a concise, clear paragraph that answers the following question in technical detail: {query}"""
+# -------------------------------------------------- #
+
+DOCUMENT_PROMPT = PromptTemplate(
+    input_variables=["page_content", "page_no", "source_id"],
+    template="***Source ID***: {source_id}\n***Page Number***: {page_no}\n\nContent: {page_content}"
+)
+LESSON_PROMPT = PromptTemplate(template=BASE_PROMPT, input_variables=["input", "domain", "context"])
+HYDE_PROMPT_TEMPLATE = PromptTemplate(template=HYDE_PROMPT, input_variables=["query", "domain"])
+# -------------------------------------------------- #
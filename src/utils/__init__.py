@@ -1 +1 @@
-__all__ = ['config', 'db_config']
\ No newline at end of file
+__all__ = ['config', 'db_config', 'parent_index', 'instrumentation', 'batch_writer']
\ No newline at end of file
@@ -0,0 +1,92 @@
+# Utils
+from utils.config import *
+from utils.instrumentation import stage
+import time
+import threading
+# ================================================== #
+
+class BatchWriter:
+    """
+    Streaming, fault-tolerant writes to a Weaviate collection.
+
+    The `BatchWriter` class sends objects through the client's batching (`fixed_size` batches sent `concurrency` requests at a time, or `dynamic` batches sized from the server load) while they are produced, so a large document is never held as one request. Objects the batch fails to write are sent again up to `max_retries` times, waiting `backoff` seconds before the first retry and twice as long before every next one. Objects should carry deterministic UUIDs (`chunk_uuid`), so a retried or repeated write replaces the object instead of duplicating it.
+
+    Attributes:
+        collection: The collection written to.
+        mode (str): "fixed" or "dynamic" batching.
+        batch_size (int): The objects per batch request (fixed mode).
+        concurrency (int): The concurrent batch requests (fixed mode).
+        max_retries (int): The maximum number of retries of failed objects.
+        backoff (float): The wait before the first retry, in seconds.
+        stats (dict): The objects written and failed, the retried objects and the busy time of all writes so far.
+
+    Methods:
+        write(objs: Iterable[DataObject], **attributes) -> dict:
+            Writes the objects (anything with `properties`, `vector` and `uuid`), timed as a `document.insert` stage with the given attributes, and returns a report: objects written, objects still failing after the retries with their error messages, retried objects, seconds and objects per second.
+
+        throughput() -> float:
+            Returns the objects written per second of write time so far.
+    """
+    def __init__(self, collection, mode=WRITE_BATCH_MODE, batch_size=WRITE_BATCH_SIZE, concurrency=WRITE_CONCURRENCY,
+                 max_retries=WRITE_MAX_RETRIES, backoff=WRITE_RETRY_BACKOFF):
+        if (mode not in ("fixed", "dynamic")):
+            raise ValueError(f"Unknown batch mode '{mode}' (expected 'fixed' or 'dynamic')")
+        self.collection = collection
+        self.mode = mode
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = {"written": 0, "failed": 0, "retried": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+    # -------------------------------------------------- #
+
+    def write(self, objs, **attributes) -> dict:
+        start = time.perf_counter()
+        with stage("document.insert", mode=self.mode, **attributes) as span:
+            sent, failed = self.send(objs)
+            retried = 0
+            for attempt in range(self.max_retries):
+                if not (failed):
+                    break
+                time.sleep(self.backoff * 2 ** attempt)
+                retried += len(failed)
+                _, failed = self.send([error.object_ for error in failed])
+            if (span): span.set(objects=sent, failed=len(failed), retried=retried)
+
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.stats["written"] += sent - len(failed)
+            self.stats["failed"] += len(failed)
+            self.stats["retried"] += retried
+            self.stats["seconds"] += seconds
+        return {
+            "written": sent - len(failed),
+            "failed": [(str(error.object_.uuid), error.message) for error in failed],
+            "retried": retried,
+            "seconds": round(seconds, 3),
+            "objects_per_second": round((sent - len(failed)) / seconds, 2) if (seconds) else 0.0,
+        }
+    # -------------------------------------------------- #
+
+    def throughput(self) -> float:
+        with self._lock:
+            return self.stats["written"] / self.stats["seconds"] if (self.stats["seconds"]) else 0.0
+    # -------------------------------------------------- #
+
+    # -- Help Functions -- #
+    def send(self, objs) -> tuple[int, list]:
+        # One batch context; the objects it could not write are reported on exit
+        sent = 0
+        with self.batch() as batch:
+            for obj in objs:
+                batch.add_object(properties=obj.properties, vector=obj.vector, uuid=obj.uuid)
+                sent += 1
+        return sent, list(self.collection.batch.failed_objects)
+    # -------------------------------------------------- #
+
+    def batch(self):
+        if (self.mode == "dynamic"):
+            return self.collection.batch.dynamic()
+        return self.collection.batch.fixed_size(batch_size=self.batch_size, concurrent_requests=self.concurrency)
+# -------------------------------------------------- #
@@ -1,43 +1,111 @@
-# Using PyTorch
-import os
-os.environ["USE_TORCH"] = "1"
-# --------------------------------------------------------------------- #
-
-from weaviate.collections.classes.grpc import Sort
-
-# Secret Keys
-from dotenv import load_dotenv
-if not os.getenv("GOOGLE_API_KEY") and not os.getenv("OPEN_AI_KEY"):
-    load_dotenv() 
-# --------------------------------------------------------------------- #
-
-# -- Constants -- #
-HOST = os.getenv('DB_HOST', 'localhost')
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-OPEN_AI_KEY = os.getenv("OPEN_AI_KEY")
-LLM_MODEL_NAME = "models/gemini-2.5-pro"
-
-# Document Load
-CHUNK_SIZE = 256
-
-# Auto Merging
-L1 = 4
-L2 = 16
-
-# Retrieving Filters
-SORT = Sort.by_property(name="index", ascending=True)
-
-# Embedding Model
-EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
-REPRESENTATION_PROMPT = "Represent this sentence for searching relevant passages: " 
-
-# Re-ranker Model
-RERANKER_MODEL_NAME = "jinaai/jina-reranker-v2-base-multilingual"
-
-# Database Name
-DB_NAME = "Edu_RAG"
-
-# RAG
-FETCHING_LIMIT = 1024
-DOCUMENT_SEPERATOR = "\n\n---\n\n"
+# Using PyTorch
+import os
+os.environ["USE_TORCH"] = "1"
+# --------------------------------------------------------------------- #
+
+# Secret Keys
+from dotenv import load_dotenv
+if not os.getenv("GOOGLE_API_KEY") and not os.getenv("OPEN_AI_KEY"):
+    load_dotenv() 
+# --------------------------------------------------------------------- #
+
+# -- Constants -- #
+HOST = os.getenv('DB_HOST', 'localhost')
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+OPEN_AI_KEY = os.getenv("OPEN_AI_KEY")
+LLM_MODEL_NAME = "models/gemini-2.5-pro"
+HYDE_MODEL_NAME = "models/gemini-2.5-flash"      # Writes the hypothetical answer used as a HyDE query
+
+# Document Load
+CHUNK_SIZE = 256
+
+# Bulk Ingestion
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", max(1, (os.cpu_count() or 2) - 1)))  # Docling conversion processes
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 128))             # Chunks per embedding micro-batch
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))                           # Capacity of the queues between stages
+INGEST_EXTENSIONS = (".pdf", ".docx", ".pptx", ".html", ".md")
+
+# Page-Sharded Conversion
+SHARD_MIN_PAGES = int(os.getenv("SHARD_MIN_PAGES", 100))        # PDFs with at least this many pages are converted in page shards
+SHARD_PAGES = int(os.getenv("SHARD_PAGES", 50))                 # Pages per shard
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", INGEST_WORKERS)) # Conversion processes of one sharded document
+TABLE_MODE = os.getenv("TABLE_MODE", "accurate")                # Table structure model: "accurate" or "fast"
+
+# Auto Merging
+L1 = int(os.getenv("AUTO_MERGE_L1", 4))         # Chunks per level 1 group (changing it re-syncs stored documents)
+L2 = int(os.getenv("AUTO_MERGE_L2", 16))        # Chunks per level 2 group (a multiple of L1)
+L1_MERGE_RATIO = float(os.getenv("L1_MERGE_RATIO", 0.5))  # Merge a level 1 group when more than this share of it is retrieved
+L2_MERGE_RATIO = float(os.getenv("L2_MERGE_RATIO", 0.5))
+PARENT_INDEX_PATH = os.getenv("PARENT_INDEX_PATH", ".parent_index/parents.sqlite")
+PARENT_INDEX_MMAP_SIZE = 256 * 1024 * 1024
+
+# Embedding Model
+EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+REPRESENTATION_PROMPT = "Represent this sentence for searching relevant passages: " 
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE")                      # None -> auto (cuda / mps / cpu)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))             # Max cached query embeddings (0 disables)
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", ".embedding_store")       # On-disk chunk embedding cache
+EMBEDDING_STORE_MAX_ENTRIES = int(os.getenv("EMBEDDING_STORE_MAX_ENTRIES", 1_000_000))
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0)) or None   # Matryoshka truncation (e.g. 256, 512), None keeps the full 1024
+
+# Vector Index
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")   # "none" | "sq" | "pq" | "bq" | "rq"
+VECTOR_RESCORE_LIMIT = int(os.getenv("VECTOR_RESCORE_LIMIT", 256))  # Candidates rescored with the uncompressed vectors
+VECTOR_TRAINING_LIMIT = int(os.getenv("VECTOR_TRAINING_LIMIT", 100_000))  # Objects used to train sq / pq codebooks
+
+# Re-ranker Model
+RERANKER_MODEL_NAME = "jinaai/jina-reranker-v2-base-multilingual"
+RERANKER_DEVICE = os.getenv("RERANKER_DEVICE")                        # None -> auto (cuda / mps / cpu)
+RERANKER_MAX_BATCH_SIZE = int(os.getenv("RERANKER_MAX_BATCH_SIZE", 64))  # Max query-document pairs per forward pass
+RERANKER_MAX_WAIT_MS = float(os.getenv("RERANKER_MAX_WAIT_MS", 5))      # Max time to wait for concurrent requests
+RERANKER_CPU_BACKEND = os.getenv("RERANKER_CPU_BACKEND", "torch")     # "torch" | "onnx" | "openvino"
+RERANKER_CPU_THREADS = int(os.getenv("RERANKER_CPU_THREADS", os.cpu_count() or 1))
+
+# Semantic Cache
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))  # Min cosine similarity between queries for a hit
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 2048))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 3600))              # Seconds
+SEMANTIC_CACHE_CHECK_INTERVAL = float(os.getenv("SEMANTIC_CACHE_CHECK_INTERVAL", 30))  # Seconds between checks of the cached sources against their manifests
+
+# Local Index
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", ".local_index")           # Memory-mapped vectors of the loaded sources
+LOCAL_INDEX_MAX_SOURCES = int(os.getenv("LOCAL_INDEX_MAX_SOURCES", 32))    # Loaded sources kept before evicting the least recently used
+LOCAL_INDEX_MAX_OBJECTS = int(os.getenv("LOCAL_INDEX_MAX_OBJECTS", 200_000))  # Loaded chunks kept across all sources
+LOCAL_INDEX_SOURCES = [s for s in os.getenv("LOCAL_INDEX_SOURCES", "").split(",") if (s)]  # Hot sources served locally (empty -> any)
+LOCAL_INDEX_CHECK_INTERVAL = float(os.getenv("LOCAL_INDEX_CHECK_INTERVAL", 30))  # Seconds before a loaded source is checked against its manifest
+
+# Database Name
+DB_NAME = os.getenv("DB_NAME", "Edu_RAG")
+SOURCES_DB_NAME = f"{DB_NAME}_Sources"     # Per-document manifest (file hash, chunk count)
+
+# Weaviate Connection Pool
+WEAVIATE_POOL_CONNECTIONS = int(os.getenv("WEAVIATE_POOL_CONNECTIONS", 20))   # Kept-alive HTTP connections
+WEAVIATE_POOL_MAXSIZE = int(os.getenv("WEAVIATE_POOL_MAXSIZE", 100))          # Max concurrent HTTP connections
+
+# Batched Writes
+WRITE_BATCH_MODE = os.getenv("WRITE_BATCH_MODE", "fixed")            # "fixed" size batches or "dynamic" (sized from the server load)
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 100))           # Objects per batch request (fixed mode)
+WRITE_CONCURRENCY = int(os.getenv("WRITE_CONCURRENCY", 2))           # Concurrent batch requests (fixed mode)
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", 3))           # Retries of the objects a batch failed to write
+WRITE_RETRY_BACKOFF = float(os.getenv("WRITE_RETRY_BACKOFF", 0.5))   # Seconds before the first retry, doubled on every retry
+
+# Server
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
+SERVER_RETRIEVAL_CONCURRENCY = int(os.getenv("SERVER_RETRIEVAL_CONCURRENCY", 16))  # Concurrent retrievals (embed, search, rerank)
+SERVER_GENERATION_CONCURRENCY = int(os.getenv("SERVER_GENERATION_CONCURRENCY", 4))  # Concurrent LLM streams
+SERVER_MAX_WAITING = int(os.getenv("SERVER_MAX_WAITING", 64))           # Requests queued per stage before answering 429
+SERVER_QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", 10))     # Seconds queued before answering 503
+SERVER_SEMANTIC_CACHE = os.getenv("SERVER_SEMANTIC_CACHE", "1") == "1"
+SERVER_LOCAL_INDEX = os.getenv("SERVER_LOCAL_INDEX", "0") == "1"              # Serve `LOCAL_INDEX_SOURCES` from the in-process index
+
+# Instrumentation
+STAGE_LOGGING = os.getenv("STAGE_LOGGING", "0") == "1"   # Log per-stage timings at startup
+
+# RAG
+FETCHING_LIMIT = 1024
+MULTI_QUERY_WORKERS = int(os.getenv("MULTI_QUERY_WORKERS", 8))           # Concurrent hybrid searches of a multi-query retrieval
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 8192))     # Context tokens of a multi-subtopic lesson
+DOCUMENT_SEPERATOR = "\n\n---\n\n"
 # --------------------------------------------------------------------- #
\ No newline at end of file
@@ -1,57 +1,192 @@
-# Config
-from utils.config import *
-import weaviate.classes.config as wc
-import weaviate
-# ================================================== #
-
-class DB:
-    """
-    Manages a local Weaviate database connection and collection.
-
-    The `DB` class provides a streamlined interface for connecting to a local Weaviate instance, creating a new collection if it doesn't already exist, and managing the database client. This is essential for setting up the vector store backend for a retrieval-augmented generation (RAG) system.
-
-    Attributes:
-        client: The Weaviate client instance for database interaction.
-        collection_name: The name of the collection to be managed.
-
-    Methods:
-        __init__(collection_name: str):
-            Initializes the DB instance with the name of the collection.
-
-        connect() -> weaviate.Client:
-            Connects to the Weaviate database. If the collection specified in the constructor does not exist, it is created automatically with a predefined schema. The method returns the connected client instance.
-            
-        create():
-            Creates a new collection in the database with a specific configuration tailored for storing document chunks. The collection includes properties for tracking document metadata such as "index", "source_id", "page_no", and the text content itself.
-    """
-    def __init__(self):
-        self.client = weaviate.connect_to_local(host=HOST)
-
-    def connect(self):
-        if not (self.client.collections.exists(DB_NAME)):
-            self.create()
-        
-        return self.client
-    
-    def create(self):
-        self.client.collections.create(
-        name=DB_NAME,
-        vector_config=wc.Configure.Vectors.self_provided(
-            vector_index_config=wc.Configure.VectorIndex.hnsw(
-                distance_metric=wc.VectorDistances.COSINE
-            )
-        ),
-        properties=[
-            wc.Property(name="index", data_type=wc.DataType.INT, vectorize_property_name=False),
-            wc.Property(name="source_id", data_type=wc.DataType.TEXT),
-            wc.Property(name="page_no", data_type=wc.DataType.TEXT),
-            wc.Property(
-                name="text",
-                data_type=wc.DataType.TEXT,
-                tokenization=wc.Tokenization.LOWERCASE,
-            ),
-            wc.Property(name="l1", data_type=wc.DataType.INT, vectorize_property_name= False),
-            wc.Property(name="l2", data_type=wc.DataType.INT, vectorize_property_name= False),
-        ]
-    )
-# -------------------------------------------------- #
\ No newline at end of file
+# Config
+from utils.config import *
+from utils.helpers import truncate_embeddings
+from utils.batch_writer import BatchWriter
+import weaviate.classes.config as wc
+from weaviate.config import AdditionalConfig, ConnectionConfig
+from weaviate.classes.data import DataObject
+import weaviate
+import threading
+# ================================================== #
+
+CONTENT_HASH_PROPERTY = wc.Property(name="content_hash", data_type=wc.DataType.TEXT,
+                                    tokenization=wc.Tokenization.FIELD, index_searchable=False)
+# Auto-merge group sizes a document was stored with
+GROUP_PROPERTIES = [wc.Property(name="l1", data_type=wc.DataType.INT), wc.Property(name="l2", data_type=wc.DataType.INT)]
+
+# -- Vector Index Profile -- #
+def quantizer_config(quantization=VECTOR_QUANTIZATION, rescore_limit=VECTOR_RESCORE_LIMIT, training_limit=VECTOR_TRAINING_LIMIT):
+    # Compressed vectors are searched in memory, the top `rescore_limit` candidates are rescored with the uncompressed vectors kept on disk
+    quantizers = {
+        "none": lambda: None,
+        "sq": lambda: wc.Configure.VectorIndex.Quantizer.sq(rescore_limit=rescore_limit, training_limit=training_limit),
+        "pq": lambda: wc.Configure.VectorIndex.Quantizer.pq(training_limit=training_limit),
+        "bq": lambda: wc.Configure.VectorIndex.Quantizer.bq(rescore_limit=rescore_limit),
+        "rq": lambda: wc.Configure.VectorIndex.Quantizer.rq(rescore_limit=rescore_limit),
+    }
+    if (quantization not in quantizers):
+        raise ValueError(f"Unknown vector quantization '{quantization}', expected one of {list(quantizers)}")
+    return quantizers[quantization]()
+
+def vector_config(quantization=VECTOR_QUANTIZATION, rescore_limit=VECTOR_RESCORE_LIMIT):
+    return wc.Configure.Vectors.self_provided(
+        vector_index_config=wc.Configure.VectorIndex.hnsw(
+            distance_metric=wc.VectorDistances.COSINE,
+            quantizer=quantizer_config(quantization, rescore_limit),
+        )
+    )
+# -------------------------------------------------- #
+
+# -- Connection Pool -- #
+def connection_config(pool_connections=WEAVIATE_POOL_CONNECTIONS, pool_maxsize=WEAVIATE_POOL_MAXSIZE) -> AdditionalConfig:
+    return AdditionalConfig(connection=ConnectionConfig(session_pool_connections=pool_connections,
+                                                        session_pool_maxsize=pool_maxsize))
+# -------------------------------------------------- #
+
+class DB:
+    """
+    Manages a local Weaviate database connection and collection.
+
+    The `DB` class provides a streamlined interface for connecting to a local Weaviate instance, creating a new collection if it doesn't already exist, and managing the database client. This is essential for setting up the vector store backend for a retrieval-augmented generation (RAG) system.
+
+    Attributes:
+        client: The Weaviate client instance for database interaction (connected on first access).
+        quantization (str): The vector compression of new collections: "none", "sq" (8-bit scalar), "pq" (product), "bq" (binary) or "rq" (rotational). Compressed indexes rescore their top candidates with the uncompressed vectors.
+        dimensions (int): The embedding dimension stored in new collections (None keeps the model dimension). It must match the `dimensions` of the `Embedding` used for ingestion and queries.
+
+    Methods:
+        __init__(quantization: str = VECTOR_QUANTIZATION, dimensions: int = EMBEDDING_DIMENSIONS):
+            Sets the vector profile used when collections are created. The connection to the local Weaviate instance (with a pool of `WEAVIATE_POOL_CONNECTIONS` kept-alive connections) is opened on first use.
+
+        connect() -> weaviate.Client:
+            Connects to the Weaviate database. If the collection specified in the constructor does not exist, it is created automatically with a predefined schema, otherwise missing properties are added to it. The sources manifest collection is created as well. The method returns the connected client instance.
+
+
+        connect_async() -> weaviate.WeaviateAsyncClient:
+            Opens and returns a connected async client to the same Weaviate instance, for the asynchronous retrieval methods.
+            
+        create(name: str = DB_NAME):
+            Creates a new collection in the database with a specific configuration tailored for storing document chunks. The collection includes properties for tracking document metadata such as "index", "source_id", "page_no", the text content itself and a "content_hash" of the text.
+
+        upgrade():
+            Adds properties introduced in later versions (such as "content_hash") to an existing chunks collection, and the auto-merge group sizes ("l1", "l2") to an existing sources manifest collection.
+
+        create_sources(name: str = SOURCES_DB_NAME):
+            Creates the sources manifest collection, holding one object per document with its file hash, chunk count and the auto-merge group sizes (`L1`, `L2`) it was stored with.
+
+        migrate(target: str, batch_size: int = 256, delete_source: bool = False) -> int:
+            Re-indexes the `DB_NAME` collection and its sources manifest into `target` / `{target}_Sources` with the current vector profile, keeping object UUIDs and truncating vectors to `dimensions`. Point `DB_NAME` at the target afterwards. Returns the number of chunks copied.
+    """
+    def __init__(self, quantization=VECTOR_QUANTIZATION, dimensions=EMBEDDING_DIMENSIONS):
+        self.quantization = quantization
+        self.dimensions = dimensions
+        self._client = None
+
+    @property
+    def client(self) -> weaviate.WeaviateClient:
+        # Connects on first use
+        if (self._client is None):
+            self._client = weaviate.connect_to_local(host=HOST, additional_config=connection_config())
+        return self._client
+
+    def connect(self):
+        if not (self.client.collections.exists(DB_NAME)):
+            self.create()
+        else:
+            self.upgrade()
+
+        if not (self.client.collections.exists(SOURCES_DB_NAME)):
+            self.create_sources()
+        
+        return self.client
+    
+    async def connect_async(self) -> weaviate.WeaviateAsyncClient:
+        # Call `connect()` first so the collections exist
+        async_client = weaviate.use_async_with_local(host=HOST, additional_config=connection_config())
+        await async_client.connect()
+        return async_client
+
+    def create(self, name=DB_NAME):
+        self.client.collections.create(
+        name=name,
+        vector_config=vector_config(self.quantization),
+        properties=[
+            wc.Property(name="index", data_type=wc.DataType.INT, vectorize_property_name=False),
+            wc.Property(name="source_id", data_type=wc.DataType.TEXT),
+            wc.Property(name="page_no", data_type=wc.DataType.TEXT),
+            wc.Property(
+                name="text",
+                data_type=wc.DataType.TEXT,
+                tokenization=wc.Tokenization.LOWERCASE,
+            ),
+            wc.Property(name="l1", data_type=wc.DataType.INT, vectorize_property_name= False),
+            wc.Property(name="l2", data_type=wc.DataType.INT, vectorize_property_name= False),
+            CONTENT_HASH_PROPERTY,
+        ]
+    )
+
+    def upgrade(self):
+        # Add properties introduced after the collection was created
+        collection = self.client.collections.get(DB_NAME)
+        properties = {prop.name for prop in collection.config.get().properties}
+        if ("content_hash" not in properties):
+            collection.config.add_property(CONTENT_HASH_PROPERTY)
+
+        if (self.client.collections.exists(SOURCES_DB_NAME)):
+            sources = self.client.collections.get(SOURCES_DB_NAME)
+            properties = {prop.name for prop in sources.config.get().properties}
+            for prop in GROUP_PROPERTIES:
+                if (prop.name not in properties):
+                    sources.config.add_property(prop)
+
+    def create_sources(self, name=SOURCES_DB_NAME):
+        self.client.collections.create(
+        name=name,
+        properties=[
+            wc.Property(name="source_id", data_type=wc.DataType.TEXT, tokenization=wc.Tokenization.FIELD),
+            wc.Property(name="file_hash", data_type=wc.DataType.TEXT, tokenization=wc.Tokenization.FIELD, index_searchable=False),
+            wc.Property(name="chunks", data_type=wc.DataType.INT),
+            *GROUP_PROPERTIES,
+        ]
+    )
+
+    def migrate(self, target: str, batch_size=256, delete_source=False) -> int:
+        if (self.client.collections.exists(target)):
+            raise ValueError(f"Collection '{target}' already exists")
+        self.create(target)
+        self.create_sources(f"{target}_Sources")
+
+        copied = self.copy(DB_NAME, target, batch_size, include_vector=True)
+        self.copy(SOURCES_DB_NAME, f"{target}_Sources", batch_size)
+
+        if (delete_source):
+            self.client.collections.delete([DB_NAME, SOURCES_DB_NAME])
+        return copied
+
+    def copy(self, source: str, target: str, batch_size: int, include_vector=False) -> int:
+        # Streams the objects with the cursor API, keeping UUIDs so incremental sync still matches chunks
+        if not (self.client.collections.exists(source)):
+            return 0
+        objs = (DataObject(properties=obj.properties, uuid=obj.uuid,
+                           vector=truncate_embeddings(obj.vector["default"], self.dimensions).tolist() if (include_vector) else None)
+                for obj in self.client.collections.get(source).iterator(include_vector=include_vector))
+        report = BatchWriter(self.client.collections.get(target), mode="fixed", batch_size=batch_size).write(objs, source=source)
+
+        if (report["failed"]):
+            raise RuntimeError(f"Migration of '{source}' failed for {len(report['failed'])} objects: {report['failed'][0][1]}")
+        return report["written"]
+# -------------------------------------------------- #
+
+# -- Shared Instance -- #
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> weaviate.WeaviateClient:
+    # The process-wide connected client, with the collections created or upgraded on first use
+    global _client
+    if (_client is None):
+        with _client_lock:
+            if (_client is None):
+                _client = DB().connect()
+    return _client
+# -------------------------------------------------- #
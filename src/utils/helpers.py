@@ -1,24 +1,127 @@
 # Retrieving Filters
-import weaviate.classes as wvc
+from utils.config import FETCHING_LIMIT
+from functools import lru_cache
 
+# Weaviate is imported on first use, modules that only hash or merge pages do not pay for it
 def id_filter(source_id: str):
-    return wvc.query.Filter.by_property("source_id").equal(source_id)
+    from weaviate.classes.query import Filter
+    return Filter.by_property("source_id").equal(source_id)
 
 def ids_filter(source_ids: list[str]):
-    return wvc.query.Filter.by_property("source_id").contains_any(source_ids)
+    from weaviate.classes.query import Filter
+    return Filter.by_property("source_id").contains_any(source_ids)
 
 def page_filter(page_no: int):
-    return wvc.query.Filter.by_property("page_no").equal(page_no)
+    from weaviate.classes.query import Filter
+    return Filter.by_property("page_no").equal(page_no)
+
+def uuids_filter(uuids: list):
+    from weaviate.classes.query import Filter
+    return Filter.by_id().contains_any(uuids)
+
+@lru_cache(maxsize=None)
+def index_sort():
+    from weaviate.classes.query import Sort
+    return Sort.by_property(name="index", ascending=True)
+
+def fetch_all(collection, filters, **kwargs) -> list:
+    # Chunks of one source in index order, paged on the last index seen: Weaviate rejects offsets beyond QUERY_MAXIMUM_RESULTS
+    # and its cursor (`after`) cannot be filtered
+    from weaviate.classes.query import Filter
+    if (kwargs.get("return_properties") is not None) and ("index" not in kwargs["return_properties"]):
+        kwargs["return_properties"] = [*kwargs["return_properties"], "index"]
+    objects, page_filters = [], filters
+    while True:
+        page = collection.query.fetch_objects(filters=page_filters, limit=FETCHING_LIMIT, sort=index_sort(), **kwargs).objects
+        objects.extend(page)
+        if (len(page) < FETCHING_LIMIT):
+            return objects
+        page_filters = filters & Filter.by_property("index").greater_than(page[-1].properties["index"])
 
 # -- Document Metadata -- #
-from langchain_core.documents import Document
+import ast
 
-def get_page_nos(chunk: Document) -> str:
+def get_page_nos(chunk: "Document") -> str:
     pages = []
     for item in chunk.metadata['dl_meta']['doc_items']:
         for prov in item['prov']:
             pages.append(prov['page_no'])
     return str(set(pages))
 
-def get_headings(chunk: Document) -> str:
-    return ' - '.join(chunk.metadata['dl_meta']['headings'])
\ No newline at end of file
+def merge_page_nos(page_nos: list[str]) -> str:
+    pages = set()
+    for page_no in page_nos:
+        # A set of pages ("{1, 2}") or a single page ("1")
+        value = ast.literal_eval(page_no)
+        pages.update(value if (isinstance(value, (set, list, tuple))) else {value})
+    return str(pages)
+
+def get_headings(chunk: "Document") -> str:
+    return ' - '.join(chunk.metadata['dl_meta']['headings'])
+
+def estimate_tokens(text: str) -> int:
+    # About 4 characters per token for English text
+    return max(1, len(text) // 4)
+
+# -- Model Device -- #
+def get_device(device: str = None) -> str:
+    if (device):
+        return device
+    import torch
+    if (torch.cuda.is_available()):
+        return "cuda"
+    if (torch.backends.mps.is_available()):
+        return "mps"
+    return "cpu"
+
+
+# -- Embedding Dimensions -- #
+def truncate_embeddings(vectors, dimensions: int = None) -> "np.ndarray":
+    # Matryoshka truncation: keep the leading dimensions and re-normalize to unit length
+    import numpy as np
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not (dimensions) or (vectors.shape[-1] <= dimensions):
+        return vectors
+    vectors = vectors[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+# -- Content Hashing -- #
+import uuid
+import hashlib
+from urllib.request import urlopen
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    if (path.startswith(("http://", "https://"))):
+        stream = urlopen(path)
+    else:
+        stream = open(path, "rb")
+    with stream:
+        for block in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_uuid(source_id: str) -> str:
+    # Same as `weaviate.util.generate_uuid5(source_id)`
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, source_id))
+
+def chunk_uuid(source_id: str, index: int) -> str:
+    # Deterministic object UUID of a chunk, so rewriting a chunk (a retry, a resumed or repeated ingestion) replaces it
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{source_id}:{index}"))
+
+# -- Source Change Listeners -- #
+import weakref
+
+_source_listeners = weakref.WeakSet()
+
+def add_source_listener(listener):
+    # Listeners implement `on_source_change(source_id)` and are held weakly
+    _source_listeners.add(listener)
+
+def notify_source_change(source_id: str):
+    for listener in list(_source_listeners):
+        listener.on_source_change(source_id)
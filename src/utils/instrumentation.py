@@ -0,0 +1,194 @@
+# Utils
+from utils.config import *
+import time
+import logging
+import threading
+from collections import defaultdict
+# ================================================== #
+
+# -- Stage Spans -- #
+class Span:
+    """
+    Timing and size record of one pipeline stage, used as a context manager.
+
+    Attributes:
+        name (str): The stage name (e.g. "retriever.hybrid").
+        attributes (dict): Counts and sizes recorded for the stage (e.g. candidates, bytes).
+        start_ns (int): The wall-clock start time in nanoseconds since the epoch.
+        duration (float): The duration of the stage in seconds.
+    """
+    __slots__ = ("instrumentation", "name", "attributes", "start_ns", "duration", "_t0")
+
+    def __init__(self, instrumentation, name: str, attributes: dict):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = 0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._t0
+        if (exc_type is not None):
+            self.attributes["error"] = exc_type.__name__
+        self.instrumentation.emit(self)
+        return False
+
+    def __bool__(self) -> bool:
+        return True
+
+    @property
+    def end_ns(self) -> int:
+        return self.start_ns + int(self.duration * 1e9)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+# -------------------------------------------------- #
+
+class _NoopSpan:
+    # Returned while no sink is registered; falsy so callers can skip computing attributes
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __bool__(self) -> bool:
+        return False
+
+    def set(self, **attributes):
+        return
+
+NOOP_SPAN = _NoopSpan()
+# -------------------------------------------------- #
+
+class Instrumentation:
+    """
+    Records per-stage timings and sizes across ingestion and retrieval and sends them to pluggable sinks.
+
+    While no sink is registered, `stage()` returns a shared no-op span, so instrumented code costs one call and one check.
+
+    Methods:
+        stage(name: str, **attributes) -> Span:
+            Returns a context manager timing the stage. Attributes can be added while it runs with `span.set(...)`.
+
+        add_sink(sink) / remove_sink(sink):
+            Registers or removes a sink. A sink is any object with a `record(span: Span)` method.
+    """
+    def __init__(self):
+        self.sinks = []
+
+    def stage(self, name: str, **attributes):
+        if not (self.sinks):
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def add_sink(self, sink):
+        self.sinks = self.sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks = [s for s in self.sinks if (s is not sink)]
+
+    def emit(self, span: Span):
+        for sink in self.sinks:
+            sink.record(span)
+# -------------------------------------------------- #
+
+# -- Sinks -- #
+class LoggingSink:
+    """
+    Logs one line per stage: name, duration and attributes.
+    """
+    def __init__(self, logger: logging.Logger = None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("edu_rag.stages")
+        self.level = level
+
+    def record(self, span: Span):
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        self.logger.log(self.level, "%s %.2fms %s", span.name, span.duration * 1000, attributes)
+# -------------------------------------------------- #
+
+class PrometheusSink:
+    """
+    Aggregates stage timings into Prometheus-style metrics, rendered in the text exposition format by `render()`.
+
+    Exposes `<prefix>_stage_seconds` (histogram per stage) and `<prefix>_stage_<attribute>_total` (sum of each numeric attribute per stage).
+    """
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, prefix="edu_rag", buckets=BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._sums = defaultdict(float)
+        self._totals = defaultdict(float)
+
+    def record(self, span: Span):
+        with self._lock:
+            counts = self._counts[span.name]
+            for i, bound in enumerate(self.buckets):
+                if (span.duration <= bound):
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[span.name] += span.duration
+            for key, value in span.attributes.items():
+                if (isinstance(value, (int, float))) and not (isinstance(value, bool)):
+                    self._totals[(span.name, key)] += value
+
+    def render(self) -> str:
+        metric = f"{self.prefix}_stage_seconds"
+        lines = [f"# TYPE {metric} histogram"]
+        with self._lock:
+            for name, counts in sorted(self._counts.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {counts[-1]}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {self._sums[name]}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {counts[-1]}')
+
+            for key in sorted({key for _, key in self._totals}):
+                total = f"{self.prefix}_stage_{key}_total"
+                lines.append(f"# TYPE {total} counter")
+                for (name, attribute), value in sorted(self._totals.items()):
+                    if (attribute == key):
+                        lines.append(f'{total}{{stage="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+# -------------------------------------------------- #
+
+class CallbackSink:
+    """
+    Calls `callback(name, start_ns, end_ns, attributes)` for every stage, matching the shape of an OpenTelemetry span.
+    """
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, span: Span):
+        self.callback(span.name, span.start_ns, span.end_ns, dict(span.attributes))
+# -------------------------------------------------- #
+
+def otel_callback(tracer):
+    # Builds a `CallbackSink` callback that replays stages as spans of an OpenTelemetry tracer
+    def callback(name: str, start_ns: int, end_ns: int, attributes: dict):
+        span = tracer.start_span(name, start_time=start_ns, attributes=attributes)
+        span.end(end_time=end_ns)
+    return callback
+# -------------------------------------------------- #
+
+# -- Shared Instance -- #
+instrumentation = Instrumentation()
+stage = instrumentation.stage
+
+if (STAGE_LOGGING):
+    instrumentation.add_sink(LoggingSink())
+
+def text_bytes(objects) -> int:
+    return sum(len(obj.properties.get("text", "").encode("utf-8")) for obj in objects)
+# -------------------------------------------------- #
@@ -0,0 +1,96 @@
+# Utils
+from utils.config import *
+from utils.helpers import merge_page_nos
+import sqlite3
+import threading
+from pathlib import Path
+# ================================================== #
+
+class ParentIndex:
+    """
+    Local index of precomputed auto-merge parent chunks.
+
+    The `ParentIndex` class stores the merged text and pages of every level 1 and level 2 chunk group of a document, computed once at ingest time. Retrieval resolves auto-merge parents from it without querying the database. The index is a SQLite sidecar file opened with memory-mapped I/O.
+
+    Attributes:
+        path (str): The SQLite file of the index.
+        db (sqlite3.Connection): The connection to the index.
+
+    Methods:
+        build(source_id: str, chunks: List[dict]):
+            Replaces the parent chunks of a document, given the properties of all of its chunks ("index", "text", "page_no", "l1", "l2").
+
+        resolve(plan: Dict[str, Tuple[List[int], List[int]]]) -> Tuple[List[dict], Dict]:
+            Looks up the level 1 and level 2 parents of an auto-merge plan (`{source_id: (l1_keys, l2_keys)}`). Returns the parent properties found and the part of the plan that the index does not hold.
+
+        delete(source_id: str):
+            Removes the parent chunks of a document.
+    """
+    def __init__(self, path=PARENT_INDEX_PATH):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"PRAGMA mmap_size={PARENT_INDEX_MMAP_SIZE}")
+        self.db.execute("CREATE TABLE IF NOT EXISTS parents ("
+                        "source_id TEXT, level TEXT, key INTEGER, text TEXT, page_no TEXT, "
+                        "PRIMARY KEY (source_id, level, key))")
+        self.db.commit()
+    # -------------------------------------------------- #
+
+    def build(self, source_id: str, chunks: list[dict]):
+        groups = {}
+        for props in sorted(chunks, key=lambda props: props["index"]):
+            for level in ("l1", "l2"):
+                groups.setdefault((level, props[level]), []).append(props)
+
+        rows = []
+        for (level, key), group in groups.items():
+            text = " ".join(props["text"] for props in group)
+            page_no = merge_page_nos([props["page_no"] for props in group])
+            rows.append((source_id, level, key, text, page_no))
+
+        with self._lock:
+            self.db.execute("DELETE FROM parents WHERE source_id = ?", (source_id,))
+            self.db.executemany("INSERT INTO parents VALUES (?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+    # -------------------------------------------------- #
+
+    def resolve(self, plan: dict) -> tuple[list[dict], dict]:
+        parents, missing = [], {}
+        with self._lock:
+            for source_id, (l1_keys, l2_keys) in plan.items():
+                found = []
+                for level, keys in (("l1", l1_keys), ("l2", l2_keys)):
+                    if not (keys):
+                        continue
+                    query = f"SELECT text, page_no FROM parents WHERE source_id = ? AND level = ? AND key IN ({','.join('?' * len(keys))}) ORDER BY key"
+                    found.extend(self.db.execute(query, (source_id, level, *keys)).fetchall())
+
+                if (len(found) == len(l1_keys) + len(l2_keys)):
+                    parents.extend({"text": text, "source_id": source_id, "page_no": page_no} for text, page_no in found)
+                else:
+                    missing[source_id] = (l1_keys, l2_keys)
+        return parents, missing
+    # -------------------------------------------------- #
+
+    def delete(self, source_id: str):
+        with self._lock:
+            self.db.execute("DELETE FROM parents WHERE source_id = ?", (source_id,))
+            self.db.commit()
+    # -------------------------------------------------- #
+
+# -- Shared Instance -- #
+_parent_index = None
+_parent_index_lock = threading.Lock()
+
+def get_parent_index() -> ParentIndex:
+    global _parent_index
+    if (_parent_index is None):
+        with _parent_index_lock:
+            if (_parent_index is None):
+                _parent_index = ParentIndex()
+    return _parent_index
+# -------------------------------------------------- #